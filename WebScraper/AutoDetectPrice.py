@@ -1,24 +1,42 @@
 import re
+import time
+import threading
 import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.firefox.service import Service
-import platform
+from collections import OrderedDict
+from functools import lru_cache
+from bs4 import BeautifulSoup, Tag
 from urllib.parse import urlparse
 import JsonHandler
+import RenderWorker
+import SelectorEngine
+import HttpClient
+import StructuredData
+import LogHandler as lh
+import ParsePool
 
-if platform.system() == "Windows":
-    #GECKODRIVER_PATH = r"C:\\Coding\\Github\\WebScrapingDiscordBot\\WebScraper\\bin\\geckodriver\\geckodriver.exe"
-    GECKODRIVER_PATH = r"C:\Users\adami\Desktop\Personal-Github\WebScrapingDiscordBot\WebScraper\bin\geckodriver\geckodriver.exe"
-else:
-    GECKODRIVER_PATH = "/usr/bin/geckodriver"
+# Compiled once, the candidate scan runs these on every text node and element
+PRICE_RE = re.compile(r'(\$|€|£|¥|₹|USD|EUR|GBP|CAD|AUD|CHF|RUB|\bkr\b|\bPLN\b|\bCZK\b|\bSEK\b|\bNOK\b|\bDKK\b)?\s?\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?\s?(USD|EUR|GBP|CAD|AUD|CHF|RUB|kr|PLN|CZK|SEK|NOK|DKK|€|£|¥|₹)?', re.I)
+COLOR_RE = re.compile(r'color\s*:\s*([^;]+)')
+RGB_RE = re.compile(r'rgb\((\d+),\s*(\d+),\s*(\d+)\)')
+CLASS_ESCAPE_RE = re.compile(r'([\.:\[\]])')
+CURRENCY_CLEAN_RE = re.compile(r'[$€£¥₹USD|EUR|GBP|CAD|AUD|CHF|RUB|kr|PLN|CZK|SEK|NOK|DKK\s]+', re.I)
+SELECTOR_HINT_RE = re.compile(r'price|amount|cost|total', re.I)
+LEADING_CURRENCY_RE = re.compile(r'^\s*[$€£¥₹]?')
+DIGIT_RE = re.compile(r'\d')
+CURRENCY_SYMBOL_RE = re.compile(r'[$€£¥₹]')
+WORD_RE = re.compile(r'[a-zA-Z]{2,}')
+# Fetched pages are kept briefly so a retried /add command doesn't load them again
+SNAPSHOT_TTL = 300
+SNAPSHOT_CACHE_SIZE = 32
+STRIKE_TAGS = ('s', 'strike', 'del')
 
+@lru_cache(maxsize=1024)
 def is_grey_color(color_str):
     """Return True if the color string represents a shade of grey."""
     color_str = color_str.strip().lower()
     if color_str in ['grey', 'gray']:
         return True
-    rgb_match = re.match(r'rgb\((\d+),\s*(\d+),\s*(\d+)\)', color_str)
+    rgb_match = RGB_RE.match(color_str)
     if rgb_match:
         r, g, b = map(int, rgb_match.groups())
     elif color_str.startswith('#'):
@@ -36,15 +54,68 @@ def is_grey_color(color_str):
     return False
 
 def fetch_html(url, use_js=False):
-    """Fetch HTML from a URL, optionally using Selenium for JS rendering."""
-    options = webdriver.FirefoxOptions()
-    options.add_argument('--headless')
-    service = Service(GECKODRIVER_PATH)
-    driver = webdriver.Firefox(service=service, options=options)
-    driver.get(url)
-    html = driver.page_source
-    driver.quit()
-    return html
+    """Fetch HTML from a URL, optionally using Selenium for JS rendering.
+
+    Renders join the scan's tab queue, so a detection never waits for a whole browser.
+    """
+    if use_js:
+        future = RenderWorker.submit(url, [], uses_lean_render(url))
+        try:
+            return future.result(timeout=RenderWorker.RENDER_WAIT_TIMEOUT)
+        except TimeoutError:
+            future.cancel()
+            raise
+    return HttpClient.get_text(url)
+
+class PageSnapshots:
+    """The plain and the rendered HTML of one URL, each fetched and parsed at most once."""
+
+    def __init__(self, url):
+        self.url = url
+        self.created = time.monotonic()
+        self._lock = threading.Lock()
+        self._html = {}
+        self._roots = {}
+
+    def html(self, rendered):
+        with self._lock:
+            if rendered not in self._html:
+                try:
+                    self._html[rendered] = fetch_html(self.url, use_js=rendered) or ""
+                except Exception as e:
+                    # Not cached, a retried command fetches again
+                    lh.log(f"Failed to fetch {'rendered' if rendered else 'plain'} HTML for {self.url}: {e}", "warn")
+                    return ""
+            return self._html[rendered]
+
+    def root(self, rendered):
+        html = self.html(rendered)
+        with self._lock:
+            if rendered not in self._html:
+                # The fetch failed, parse nothing and let a retry fetch again
+                return SelectorEngine.parse_html(html)
+            if rendered not in self._roots:
+                self._roots[rendered] = SelectorEngine.parse_html(html)
+            return self._roots[rendered]
+
+    def select(self, selectors, rendered):
+        return SelectorEngine.select_texts_from_root(self.root(rendered), selectors)
+
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+def get_snapshots(url):
+    """Return the shared PageSnapshots for a URL, reusing one fetched in the last SNAPSHOT_TTL seconds."""
+    now = time.monotonic()
+    with _snapshots_lock:
+        for cached_url in [u for u, snap in _snapshots.items() if now - snap.created > SNAPSHOT_TTL]:
+            del _snapshots[cached_url]
+        snapshots = _snapshots.get(url)
+        if snapshots is None:
+            snapshots = _snapshots[url] = PageSnapshots(url)
+            while len(_snapshots) > SNAPSHOT_CACHE_SIZE:
+                _snapshots.popitem(last=False)
+        return snapshots
 
 def get_domain(url):
     """Extract the domain from a URL."""
@@ -56,62 +127,74 @@ def get_domain(url):
 
 def clean_price_text(price_text):
     """Remove currency symbols and whitespace from price text."""
-    return re.sub(r'[$€£¥₹USD|EUR|GBP|CAD|AUD|CHF|RUB|kr|PLN|CZK|SEK|NOK|DKK\s]+', '', price_text, flags=re.I)
+    return CURRENCY_CLEAN_RE.sub('', price_text)
+
+def is_crossed_out(tag):
+    """True if this element itself strikes or greys out its content (ancestors not included)."""
+    if tag.name in STRIKE_TAGS:
+        return True
+    style = tag.get('style', '')
+    if 'line-through' in style:
+        return True
+    if tag.get('data-a-strike') == 'true':
+        return True
+    color_match = COLOR_RE.search(style)
+    return bool(color_match and is_grey_color(color_match.group(1)))
 
 def find_price_candidates(soup):
-    """Find all price-like text candidates in the soup."""
-    price_regex = re.compile(r'(\$|€|£|¥|₹|USD|EUR|GBP|CAD|AUD|CHF|RUB|\bkr\b|\bPLN\b|\bCZK\b|\bSEK\b|\bNOK\b|\bDKK\b)?\s?\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?\s?(USD|EUR|GBP|CAD|AUD|CHF|RUB|kr|PLN|CZK|SEK|NOK|DKK|€|£|¥|₹)?', re.I)
+    """Find all price-like text candidates in the soup.
+
+    One top-down walk carries the inherited crossed-out state and the same-name
+    sibling index of every element, selectors are only built for candidate parents.
+    """
     candidates = []
-    for el in soup.find_all(string=True):
-        text = el.strip()
-        if not text:
-            continue
-        if price_regex.search(text):
-            parent = el.parent
-            if parent.name in ['s', 'strike', 'del']:
-                continue
-            style = parent.get('style', '')
-            if 'line-through' in style or 'text-decoration:line-through' in style:
-                continue
-            color_match = re.search(r'color\s*:\s*([^;]+)', style)
-            if color_match and is_grey_color(color_match.group(1)):
-                continue
-            ancestor = parent
-            crossed_out = False
-            while ancestor:
-                if ancestor.name in ['s', 'strike', 'del']:
-                    crossed_out = True
-                    break
-                style = ancestor.get('style', '')
-                if 'line-through' in style or 'text-decoration:line-through' in style:
-                    crossed_out = True
-                    break
-                if ancestor.has_attr('data-a-strike') and ancestor['data-a-strike'] == 'true':
-                    crossed_out = True
-                    break
-                color_match = re.search(r'color\s*:\s*([^;]+)', style)
-                if color_match and is_grey_color(color_match.group(1)):
-                    crossed_out = True
-                    break
-                ancestor = ancestor.parent if hasattr(ancestor, 'parent') else None
+    sibling_index = {}
+    selectors = {}
+    # (node, crossed out by itself or an ancestor), strings are visited in document order
+    stack = [(soup, is_crossed_out(soup))]
+    while stack:
+        node, crossed_out = stack.pop()
+        if not isinstance(node, Tag):
             if crossed_out:
                 continue
-            selector = get_css_selector(parent)
-            font_size = None
-            if 'font-size' in style:
-                match = re.search(r'font-size\s*:\s*([\d.]+)px', style)
-                if match:
-                    font_size = float(match.group(1))
-            candidates.append((parent, selector, text, font_size))
+            text = node.strip()
+            if text and PRICE_RE.search(text):
+                parent = node.parent
+                # The legacy scan read font-size from the document root's style, which is
+                # always empty, so candidates never carried one and scoring relies on that
+                candidates.append((parent, get_css_selector(parent, sibling_index, selectors), text, None))
+            continue
+        seen_names = {}
+        children = []
+        for child in node.contents:
+            if isinstance(child, Tag):
+                count = seen_names.get(child.name, 0)
+                sibling_index[id(child)] = count
+                seen_names[child.name] = count + 1
+                children.append((child, crossed_out or is_crossed_out(child)))
+            else:
+                children.append((child, crossed_out))
+        stack.extend(reversed(children))
     return candidates
 
 def escape_class(cls):
     # Escape . : [ ] for CSS selectors
-    return re.sub(r'([\.:\[\]])', r'\\\1', cls)
+    return CLASS_ESCAPE_RE.sub(r'\\\1', cls)
 
-def get_css_selector(element):
+def get_css_selector(element, sibling_index=None, cache=None):
+    """Build the CSS path of an element, up to the first ancestor with an id or a unique class.
+
+    sibling_index maps id(element) to its number of previous same-name siblings and cache
+    holds already built selectors, both are filled in by find_price_candidates.
+    """
+    if cache is not None and id(element) in cache:
+        return cache[id(element)]
+    start = element
     path = []
     while element and element.name != '[document]':
+        if cache is not None and element is not start and id(element) in cache:
+            path.insert(0, cache[id(element)])
+            break
         selector = element.name
         if element.get('id'):
             selector += f"#{element['id']}"
@@ -121,23 +204,29 @@ def get_css_selector(element):
             valid_classes = [escape_class(cls) for cls in element.get('class', []) if not any(c in cls for c in '[]:')]
             if valid_classes:
                 selector += '.' + '.'.join(valid_classes)
-        siblings = element.find_previous_siblings(element.name)
+        if sibling_index is not None and id(element) in sibling_index:
+            siblings = sibling_index[id(element)]
+        else:
+            siblings = len(element.find_previous_siblings(element.name))
         if siblings:
-            selector += f":nth-child({len(siblings)+1})"
+            selector += f":nth-child({siblings+1})"
         path.insert(0, selector)
         if element.get('class') and not siblings:
             break
         element = element.parent
-    return ' > '.join(path)
+    result = ' > '.join(path)
+    if cache is not None:
+        cache[id(start)] = result
+    return result
 
 def score_candidate(el, selector, text, font_size=None):
     """Score a price candidate based on heuristics."""
     score = 0
-    if re.search(r'price|amount|cost|total', selector, re.I):
+    if SELECTOR_HINT_RE.search(selector):
         score += 5
     if len(text) < 20:
         score += 2
-    if re.match(r'^\s*[$€£¥₹]?', text) and re.search(r'\d', text):
+    if LEADING_CURRENCY_RE.match(text) and DIGIT_RE.search(text):
         score += 2
     if el.name in ['span', 'div', 'p', 'b', 'strong']:
         score += 1
@@ -145,7 +234,7 @@ def score_candidate(el, selector, text, font_size=None):
         score -= 10
     if font_size:
         score += min(15, font_size / 2)
-    if re.search(r'[$€£¥₹]', text):
+    if CURRENCY_SYMBOL_RE.search(text):
         score += 4
     if el.has_attr('class') and 'promo-price' in el['class']:
         score += 8
@@ -157,44 +246,77 @@ def score_candidate(el, selector, text, font_size=None):
         score -= (el.sourceline // 50)
     if re.search(r',-', text):
         score += 5
-    if re.search(r'[a-zA-Z]{2,}', text):
+    if WORD_RE.search(text):
         score -= 5
     return score
 
-def try_known_selectors(url):
+def get_known_selectors(url):
     domain = get_domain(url)
     selector_data = JsonHandler.get_selector_data()
     entry = selector_data.get(domain, {})
-    selectors = entry.get("selectors", []) if isinstance(entry, dict) else entry
-    js_required = entry.get("js", True) if isinstance(entry, dict) else True
+    return entry.get("selectors", []) if isinstance(entry, dict) else entry
+
+def uses_lean_render(url):
+    """False when selector_data.json sets "lean_render": false for the domain, e.g. if its price needs images or fonts."""
+    entry = JsonHandler.get_selector_data().get(get_domain(url), {})
+    return entry.get("lean_render", True) if isinstance(entry, dict) else True
+
+def try_known_selectors(snapshots, selectors, rendered):
     if not selectors:
-        return None, None, None
-    html = fetch_html(url, use_js=js_required)
-    soup = BeautifulSoup(html, 'lxml')
+        return None, None
+    texts = snapshots.select(selectors, rendered)
     for selector in selectors:
-        el = soup.select_one(selector)
-        if el:
-            price_text = el.get_text(strip=True)
+        price_text = texts[selector]
+        if price_text is not None:
             cleaned = clean_price_text(price_text)
             if cleaned:
-                return cleaned, selector, js_required
-    return None, None, None
+                return cleaned, selector
+    return None, None
 
-def auto_detect_price(url):
-    # Try known selectors first
-    price, selector, js_used = try_known_selectors(url)
-    if price is not None:
-        return price, selector, js_used
-    # Fallback to auto-detection
-    html = fetch_html(url, use_js=True)
-    soup = BeautifulSoup(html, 'lxml')
-    candidates = find_price_candidates(soup)
+def try_structured_data(snapshots, rendered):
+    """Look for a JSON-LD / microdata / product meta price in one of the page snapshots."""
+    price = StructuredData.extract_price(snapshots.root(rendered))
+    if price:
+        return price, StructuredData.STRUCTURED_SELECTOR
+    return None, None
+
+def heuristic_price(html):
+    """(price, selector) of the best scoring candidate in html, runs in a parse worker."""
+    candidates = find_price_candidates(BeautifulSoup(html, 'lxml'))
     if not candidates:
-        return None, None, None
+        return None, None
     scored = [(score_candidate(el, sel, txt, font_size), el, sel, txt) for el, sel, txt, font_size in candidates]
     scored.sort(key=lambda x: x[0], reverse=True)
-    if not scored:
-        return None, None, None
     best = scored[0]
-    cleaned_best = clean_price_text(best[1].get_text(strip=True))
-    return cleaned_best, best[2], True  # Always return js=True
+    return clean_price_text(best[1].get_text(strip=True)), best[2]
+
+def try_heuristics(snapshots):
+    return ParsePool.run_sync(heuristic_price, snapshots.html(True))
+
+def works_without_js(snapshots, selector, price):
+    """True if the selector finds the same cleaned price in the plain HTML snapshot."""
+    price_text = snapshots.select([selector], False)[selector]
+    return bool(price_text) and clean_price_text(price_text) == price
+
+def auto_detect_price(url):
+    """Detect (price, selector, js_required) for a URL.
+
+    The plain HTML is fetched once and the page rendered at most once, every stage
+    (known selectors, structured data, heuristics, the JS check) shares both snapshots.
+    """
+    snapshots = get_snapshots(url)
+    known_selectors = get_known_selectors(url)
+    # (needs the rendered page, stage), cheap plain HTML stages first
+    stages = [
+        (False, lambda: try_known_selectors(snapshots, known_selectors, False)),
+        (False, lambda: try_structured_data(snapshots, False)),
+        (True, lambda: try_known_selectors(snapshots, known_selectors, True)),
+        (True, lambda: try_structured_data(snapshots, True)),
+        (True, lambda: try_heuristics(snapshots)),
+    ]
+    for rendered, stage in stages:
+        price, selector = stage()
+        if price:
+            js_required = rendered and not works_without_js(snapshots, selector, price)
+            return price, selector, js_required
+    return None, None, None
@@ -0,0 +1,132 @@
+import time
+import LogHandler as lh
+import ScrapeResult
+from AutoDetectPrice import get_domain
+
+# Distinct pages on a domain that failed since its last success before its trackers are skipped
+FAILURE_THRESHOLD = 5
+# How long an opened breaker skips the domain, doubled after every failed probe
+COOLDOWN = 600
+MAX_COOLDOWN = 6 * 3600
+# A page failed to fetch when every tracker on it ended in one of these
+FETCH_FAILURES = (ScrapeResult.TRANSIENT, ScrapeResult.BLOCKED)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class Breaker:
+    def __init__(self):
+        self.state = CLOSED
+        # Keys of the pages that failed since the domain last worked, so one
+        # page failing scan after scan counts once
+        self.failed_pages = set()
+        self.missed_pages = set()
+        self.cooldown = COOLDOWN
+        self.retry_at = 0.0
+        self.probing = False
+        self.last_failure = None
+
+    @property
+    def failures(self):
+        return len(self.failed_pages | self.missed_pages)
+
+
+_breakers = {}
+
+
+def page_outcome(results):
+    """Classify a page's final results as "fetch" when it couldn't be fetched, "miss" when no
+    tracker on it found a price (known selectors and structured data included) or "ok".
+
+    A single missing page is usually a sold-out or removed product, many distinct
+    ones at once a bot-challenge or error page.
+    """
+    if all(result.status in FETCH_FAILURES for result in results):
+        return "fetch"
+    if all(result.status in FETCH_FAILURES + (ScrapeResult.SELECTOR_MISS,) for result in results):
+        return "miss"
+    return "ok"
+
+
+def allow(url):
+    """True if a page on the URL's domain may be scraped, an open breaker lets a single probe through after its cool-down."""
+    domain = get_domain(url)
+    breaker = _breakers.get(domain)
+    if breaker is None or breaker.state == CLOSED:
+        return True
+    if breaker.state == OPEN and time.monotonic() >= breaker.retry_at:
+        breaker.state = HALF_OPEN
+        breaker.probing = False
+    if breaker.state == HALF_OPEN and not breaker.probing:
+        breaker.probing = True
+        lh.log(f"Probing {domain} with a single page after its cool-down", "log")
+        return True
+    return False
+
+
+def is_open(url):
+    """True while the domain is skipped, a page being probed in half-open state keeps going."""
+    breaker = _breakers.get(get_domain(url))
+    return breaker is not None and breaker.state == OPEN
+
+
+def _open(domain, breaker):
+    breaker.state = OPEN
+    breaker.probing = False
+    breaker.retry_at = time.monotonic() + breaker.cooldown
+    lh.log(f"Circuit breaker for {domain} opened after {breaker.failures} failed pages, "
+           f"skipping its trackers for {breaker.cooldown / 60:.0f} minutes", "warn")
+
+
+def record(page, results):
+    """Update the domain's breaker with a page's final results after its retries, None when the site was never reached."""
+    domain = get_domain(page['url'])
+    key = page.get('key', page['url'])
+    breaker = _breakers.get(domain)
+    if results is None:
+        if breaker is not None:
+            breaker.probing = False
+        return
+    outcome = page_outcome(results)
+    if outcome == "ok":
+        if breaker is None:
+            return
+        if breaker.state != CLOSED:
+            lh.log(f"{domain} is answering again, closing its circuit breaker", "success")
+        del _breakers[domain]
+        return
+    if breaker is None:
+        breaker = _breakers[domain] = Breaker()
+    breaker.last_failure = f"{results[0].status}: {results[0].detail}" if results[0].detail else results[0].status
+    if outcome == "miss" and key in breaker.missed_pages and breaker.state == HALF_OPEN:
+        # The probe hit a page that was already missing, that says nothing about the shop
+        breaker.probing = False
+        return
+    (breaker.failed_pages if outcome == "fetch" else breaker.missed_pages).add(key)
+    if breaker.state == HALF_OPEN:
+        breaker.cooldown = min(MAX_COOLDOWN, breaker.cooldown * 2)
+        _open(domain, breaker)
+    elif breaker.state == CLOSED and breaker.failures >= FAILURE_THRESHOLD:
+        _open(domain, breaker)
+
+
+def get_states():
+    """Domains with failures, as dicts with domain, state, failures, retry_in (seconds) and last_failure."""
+    now = time.monotonic()
+    states = []
+    for domain, breaker in sorted(_breakers.items()):
+        states.append({
+            "domain": domain,
+            "state": breaker.state,
+            "failures": breaker.failures,
+            "retry_in": max(0.0, breaker.retry_at - now) if breaker.state == OPEN else 0.0,
+            "last_failure": breaker.last_failure,
+        })
+    return states
+
+
+def reset(domain):
+    """Close a domain's breaker by hand, returns False if it had none."""
+    return _breakers.pop(domain, None) is not None
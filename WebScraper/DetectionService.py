@@ -0,0 +1,63 @@
+import asyncio
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import LogHandler as lh
+import AutoDetectPrice
+import HttpClient
+import SelectorEngine
+
+# Detection runs page loads in these threads so command handlers never block the event loop
+DETECTION_WORKERS = 4
+# Requests waiting for or running on a worker, further requests are turned away
+MAX_PENDING = 32
+MAX_PER_USER = 2
+
+_executor = ThreadPoolExecutor(max_workers=DETECTION_WORKERS, thread_name_prefix="detect")
+atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+# Only touched from the event loop, so no lock is needed
+_pending = 0
+_in_flight = {}
+
+
+class DetectionBusy(Exception):
+    """Raised when a user or the whole service already has too many detections queued."""
+
+
+async def run(user_id, func, *args):
+    """Run a blocking detection step on the worker pool, enforcing the queue and per-user limits."""
+    global _pending
+    user_id = str(user_id)
+    if _in_flight.get(user_id, 0) >= MAX_PER_USER:
+        raise DetectionBusy(f"You already have {MAX_PER_USER} detections running, please wait for them to finish.")
+    if _pending >= MAX_PENDING:
+        raise DetectionBusy("The bot is busy detecting prices for other users, please try again in a minute.")
+    _pending += 1
+    _in_flight[user_id] = _in_flight.get(user_id, 0) + 1
+    if _pending > DETECTION_WORKERS:
+        lh.log(f"Detection for user {user_id} queued, {_pending} detection(s) pending", "log")
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, partial(func, *args))
+    finally:
+        _pending -= 1
+        _in_flight[user_id] -= 1
+        if not _in_flight[user_id]:
+            del _in_flight[user_id]
+
+
+def select_text(url, selector):
+    """Fetch the plain HTML of a page and return the selector's text, or None."""
+    return SelectorEngine.select_texts(HttpClient.get_text(url), [selector])[selector]
+
+
+async def detect_price(user_id, url):
+    """Auto-detect (price, selector, js_required) for a URL without blocking the event loop."""
+    return await run(user_id, AutoDetectPrice.auto_detect_price, url)
+
+
+async def select_plain_text(user_id, url, selector):
+    return await run(user_id, select_text, url, selector)
+
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,106 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+import JsonHandler
+import LogHandler as lh
+import ScrapeResult
+from AutoDetectPrice import get_domain
+
+# Defaults per domain, selector_data.json entries can override them with
+# "max_concurrency" and "requests_per_minute"
+DEFAULT_DOMAIN_CONCURRENCY = 2
+DEFAULT_REQUESTS_PER_MINUTE = 30
+# Random extra delay as a fraction of the request interval, so requests don't tick like a bot
+JITTER = 0.3
+# Used when a 429/503 comes without a usable Retry-After header
+DEFAULT_RETRY_AFTER = 60
+MAX_RETRY_AFTER = 900
+# Waits longer than this for a throttled domain give up on the page instead
+MAX_THROTTLE_WAIT = 30
+
+
+class DomainThrottled(ScrapeResult.ScrapeError):
+    """Raised when a domain asked us to back off for longer than MAX_THROTTLE_WAIT."""
+
+    def __init__(self, message):
+        super().__init__(ScrapeResult.BLOCKED, message)
+
+
+class DomainState:
+    def __init__(self):
+        self.condition = asyncio.Condition()
+        self.active = 0
+        self.next_slot = 0.0
+        self.blocked_until = 0.0
+
+
+_domains = {}
+
+
+def get_limits(domain):
+    """Return (max concurrency, requests per minute) for a domain from selector_data.json."""
+    entry = JsonHandler.get_selector_data().get(domain, {})
+    if not isinstance(entry, dict):
+        entry = {}
+    concurrency = entry.get("max_concurrency", DEFAULT_DOMAIN_CONCURRENCY)
+    rate = entry.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE)
+    return max(1, int(concurrency)), max(0.1, float(rate))
+
+
+def _state(domain):
+    state = _domains.get(domain)
+    if state is None:
+        state = _domains[domain] = DomainState()
+    return state
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def report_throttled(url, retry_after=None):
+    """Pause a domain after a 429/503, honoring its Retry-After header."""
+    domain = get_domain(url)
+    delay = parse_retry_after(retry_after)
+    delay = min(MAX_RETRY_AFTER, delay if delay is not None else DEFAULT_RETRY_AFTER)
+    state = _state(domain)
+    state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+    lh.log(f"{domain} asked us to slow down, pausing requests for {delay:.0f}s", "warn")
+
+
+@asynccontextmanager
+async def slot(url):
+    """Wait for a free request slot on the URL's domain within its concurrency and rate budget."""
+    domain = get_domain(url)
+    state = _state(domain)
+    concurrency, rate = get_limits(domain)
+    async with state.condition:
+        await state.condition.wait_for(lambda: state.active < concurrency)
+        state.active += 1
+    try:
+        now = time.monotonic()
+        if state.blocked_until - now > MAX_THROTTLE_WAIT:
+            raise DomainThrottled(f"{domain} is paused for another {state.blocked_until - now:.0f}s")
+        interval = 60 / rate
+        # Reserve the start time before sleeping so concurrent requests spread out
+        start = max(now, state.next_slot, state.blocked_until)
+        state.next_slot = start + interval
+        delay = start - now
+        if delay > 0:
+            await asyncio.sleep(delay + random.uniform(0, JITTER * interval))
+        yield
+    finally:
+        async with state.condition:
+            state.active -= 1
+            state.condition.notify_all()
@@ -0,0 +1,234 @@
+import atexit
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.firefox.service import Service
+from selenium.webdriver.support.ui import WebDriverWait
+import LogHandler as lh
+
+if platform.system() == "Windows":
+    #GECKODRIVER_PATH = r"C:\\Coding\\Github\\WebScrapingDiscordBot\\WebScraper\\bin\\geckodriver\\geckodriver.exe"
+    GECKODRIVER_PATH = r"C:\Users\adami\Desktop\Personal-Github\WebScrapingDiscordBot\WebScraper\bin\geckodriver\geckodriver.exe"
+else:
+    GECKODRIVER_PATH = "/usr/bin/geckodriver"
+
+# Pool defaults, PriceTracker resizes the pool to its SELENIUM_LIMIT on import
+POOL_SIZE = 2
+MAX_PAGES_PER_DRIVER = 50
+MAX_DRIVER_RSS_MB = 600
+BORROW_TIMEOUT = 120
+
+# Lean browsers skip images, web fonts and media, refuse known ad/analytics hosts and
+# return from get() at DOMContentLoaded. Domains with "lean_render": false in
+# selector_data.json are rendered by a full browser instead.
+LEAN_PREFS = {
+    "permissions.default.image": 2,
+    "gfx.downloadable_fonts.enabled": False,
+    "media.autoplay.default": 5,
+    "media.preload.default": 0,
+    "media.preload.auto": 0,
+    "media.mediasource.enabled": False,
+}
+BLOCKED_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "googleadservices.com", "facebook.net", "hotjar.com", "clarity.ms", "bat.bing.com",
+    "criteo.com", "criteo.net", "taboola.com", "outbrain.com", "scorecardresearch.com",
+    "adnxs.com", "analytics.tiktok.com",
+)
+# Blocked hosts are sent to the discard port so their requests fail immediately
+BLOCKED_HOSTS_PROXY = "PROXY 127.0.0.1:9"
+# fetch_rendered_html waits this long for the load event a lean get() no longer waits for
+LOAD_SETTLE_TIMEOUT = 5
+
+
+def blocklist_pac(hosts=BLOCKED_HOSTS):
+    """Proxy auto-config script as a data URL that refuses hosts and their subdomains."""
+    checks = " || ".join(f'host == "{host}" || dnsDomainIs(host, ".{host}")' for host in hosts)
+    script = (
+        "function FindProxyForURL(url, host) {"
+        f" if ({checks}) return \"{BLOCKED_HOSTS_PROXY}\"; return \"DIRECT\"; }}"
+    )
+    return "data:application/x-ns-proxy-autoconfig," + quote(script)
+
+
+def create_driver(lean=True):
+    """Launch a new headless Firefox instance, lean unless a full page load is needed."""
+    options = webdriver.FirefoxOptions()
+    options.add_argument('--headless')
+    if lean:
+        options.page_load_strategy = "eager"
+        for name, value in LEAN_PREFS.items():
+            options.set_preference(name, value)
+        options.set_preference("network.proxy.type", 2)
+        options.set_preference("network.proxy.autoconfig_url", blocklist_pac())
+    service = Service(GECKODRIVER_PATH)
+    return webdriver.Firefox(service=service, options=options)
+
+
+def get_driver_rss_mb(driver):
+    """Return the resident memory of the browser process in MB, or None if unknown."""
+    pid = driver.capabilities.get('moz:processID')
+    if not pid:
+        return None
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except Exception:
+        return None
+    return None
+
+
+class PooledDriver:
+    def __init__(self, driver, lean=True):
+        self.driver = driver
+        self.lean = lean
+        self.pages = 0
+        self.created = time.time()
+
+
+class DriverPool:
+    """Size-bounded pool of warm headless Firefox instances shared by all JS fetches."""
+
+    def __init__(self, size=POOL_SIZE, max_pages=MAX_PAGES_PER_DRIVER, max_rss_mb=MAX_DRIVER_RSS_MB):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self._idle = []
+        self._total = 0
+        self._cond = threading.Condition()
+
+    def resize(self, size):
+        with self._cond:
+            self.size = size
+            while self._total > self.size and self._idle:
+                self._quit(self._idle.pop())
+            self._cond.notify_all()
+
+    def _quit(self, pooled):
+        self._total -= 1
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            lh.log(f"Error quitting pooled driver: {e}", "warn")
+
+    def _is_healthy(self, pooled):
+        if pooled.pages >= self.max_pages:
+            lh.log(f"Recycling driver after {pooled.pages} pages", "log")
+            return False
+        rss = get_driver_rss_mb(pooled.driver)
+        if rss is not None and rss > self.max_rss_mb:
+            lh.log(f"Recycling driver using {rss:.0f} MB", "log")
+            return False
+        try:
+            pooled.driver.current_url
+        except Exception:
+            lh.log("Recycling unresponsive driver", "warn")
+            return False
+        return True
+
+    def acquire(self, timeout=BORROW_TIMEOUT, lean=True):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                pooled = next((p for p in reversed(self._idle) if p.lean == lean), None)
+                if pooled is not None:
+                    self._idle.remove(pooled)
+                    if self._is_healthy(pooled):
+                        return pooled
+                    self._quit(pooled)
+                    continue
+                if self._total < self.size:
+                    self._total += 1
+                    break
+                if self._idle:
+                    # Only browsers of the other profile are idle, replace the oldest one
+                    self._quit(self._idle.pop(0))
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("Timed out waiting for a browser from the pool")
+                self._cond.wait(remaining)
+        try:
+            lh.log(f"Starting new pooled {'lean' if lean else 'full'} Firefox instance", "log")
+            return PooledDriver(create_driver(lean), lean)
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, pooled, broken=False):
+        with self._cond:
+            pooled.pages += 1
+            if broken or self._total > self.size:
+                self._quit(pooled)
+            else:
+                self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def borrow(self, lean=True):
+        """Borrow a driver of the given profile for one page load and return it to the pool afterwards."""
+        with self.borrow_pooled(lean) as pooled:
+            yield pooled.driver
+
+    @contextmanager
+    def borrow_pooled(self, lean=True):
+        """Like borrow, but yields the PooledDriver so callers loading several pages can count them."""
+        pooled = self.acquire(lean=lean)
+        broken = False
+        try:
+            yield pooled
+        except Exception:
+            # A failed page load may leave the browser in a bad state, don't reuse it
+            broken = True
+            raise
+        finally:
+            self.release(pooled, broken=broken)
+
+    def shutdown(self):
+        with self._cond:
+            while self._idle:
+                self._quit(self._idle.pop())
+            self._cond.notify_all()
+
+
+_pool = DriverPool()
+atexit.register(_pool.shutdown)
+
+
+def get_pool():
+    return _pool
+
+
+def set_pool_size(size):
+    _pool.resize(size)
+
+
+def borrow_driver(lean=True):
+    return _pool.borrow(lean)
+
+
+def wait_for_load(driver, timeout=LOAD_SETTLE_TIMEOUT):
+    """Wait up to timeout for the load event, returns quietly when it doesn't come in time."""
+    try:
+        WebDriverWait(driver, timeout).until(
+            lambda d: d.execute_script("return document.readyState") == "complete"
+        )
+    except TimeoutException:
+        pass
+
+
+def fetch_rendered_html(url, lean=True):
+    """Load a URL in a pooled browser and return the rendered page source."""
+    with borrow_driver(lean) as driver:
+        driver.get(url)
+        if lean:
+            wait_for_load(driver)
+        return driver.page_source
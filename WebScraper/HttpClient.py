@@ -0,0 +1,196 @@
+import threading
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+import LogHandler as lh
+
+try:
+    import brotli  # noqa: F401 - urllib3 decodes br responses when brotli is installed
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+# Number of hosts to keep pools for, and connections kept alive per host
+POOL_HOSTS = 32
+POOL_CONNECTIONS_PER_HOST = 8
+# Total in-flight connections for the async client, shared by all hosts
+ASYNC_CONNECTION_LIMIT = 200
+ASYNC_TOTAL_TIMEOUT = 30
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "nl,en-US;q=0.7,en;q=0.3",
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Connection": "keep-alive",
+}
+
+_session = None
+_session_lock = threading.Lock()
+_async_session = None
+# Per host request and new connection counts of the aiohttp session, kept by its trace hooks
+_async_stats = {}
+
+
+def get_session():
+    """Return the process-wide requests session with per-host keep-alive pools."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_CONNECTIONS_PER_HOST)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(DEFAULT_HEADERS)
+            _session = session
+        return _session
+
+
+def get(url, timeout=None, **kwargs):
+    """GET a URL through the shared session with default connect/read timeouts."""
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    return get_session().get(url, timeout=timeout, **kwargs)
+
+
+def get_text(url, timeout=None):
+    return get(url, timeout=timeout).text
+
+
+async def _on_request_start(session, context, params):
+    context.host = params.url.host
+    _async_stats.setdefault(context.host, {"requests": 0, "connections": 0})["requests"] += 1
+
+
+async def _on_connection_create_end(session, context, params):
+    host = getattr(context, "host", None)
+    if host is not None:
+        _async_stats.setdefault(host, {"requests": 0, "connections": 0})["connections"] += 1
+
+
+def _stats_trace_config():
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    return trace_config
+
+
+def get_async_session():
+    """Return the aiohttp session used for non-JS scrapes, created on the running loop."""
+    global _async_session
+    if _async_session is None or _async_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=ASYNC_CONNECTION_LIMIT,
+            limit_per_host=POOL_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=ASYNC_TOTAL_TIMEOUT, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        _async_session = aiohttp.ClientSession(
+            connector=connector, timeout=timeout, headers=DEFAULT_HEADERS, trace_configs=[_stats_trace_config()]
+        )
+    return _async_session
+
+
+async def fetch_async(url, etag=None, last_modified=None):
+    """Conditional GET, returns status, body text and the validators to send next time.
+
+    A 304 answer has not_modified set and an empty body, retry_after carries the
+    Retry-After header of throttled responses.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    session = get_async_session()
+    async with session.get(url, headers=headers) as resp:
+        not_modified = resp.status == 304
+        text = "" if not_modified else await resp.text(errors="replace")
+        return {
+            "status": resp.status,
+            "text": text,
+            "not_modified": not_modified,
+            "etag": resp.headers.get("ETag", etag),
+            "last_modified": resp.headers.get("Last-Modified", last_modified),
+            "retry_after": resp.headers.get("Retry-After"),
+        }
+
+
+async def stream_async(url, on_chunk, etag=None, last_modified=None, chunk_size=16 * 1024):
+    """Conditional GET that passes body chunks to await on_chunk(chunk, charset).
+
+    Reading stops as soon as on_chunk returns True, the connection is then dropped
+    instead of draining the rest of the body.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    session = get_async_session()
+    async with session.get(url, headers=headers) as resp:
+        result = {
+            "status": resp.status,
+            "not_modified": resp.status == 304,
+            "complete": True,
+            "bytes": 0,
+            "etag": resp.headers.get("ETag", etag),
+            "last_modified": resp.headers.get("Last-Modified", last_modified),
+            "retry_after": resp.headers.get("Retry-After"),
+        }
+        if result["not_modified"]:
+            return result
+        async for chunk in resp.content.iter_chunked(chunk_size):
+            result["bytes"] += len(chunk)
+            if await on_chunk(chunk, resp.charset):
+                result["complete"] = resp.content.at_eof()
+                break
+        if not result["complete"]:
+            resp.close()
+        return result
+
+
+async def close_async_session():
+    global _async_session
+    if _async_session is not None and not _async_session.closed:
+        await _async_session.close()
+    _async_session = None
+
+
+def get_pool_stats():
+    """Return per-host request and connection counts with the keep-alive reuse rate.
+
+    Counts of the requests session and the aiohttp session are added up.
+    """
+    stats = {host: dict(entry) for host, entry in list(_async_stats.items())}
+    adapters = {id(adapter): adapter for adapter in _session.adapters.values()} if _session is not None else {}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host
+            entry = stats.setdefault(host, {"requests": 0, "connections": 0})
+            entry["requests"] += pool.num_requests
+            entry["connections"] += pool.num_connections
+    for host, entry in stats.items():
+        if entry["requests"]:
+            entry["reuse_rate"] = round(1 - entry["connections"] / entry["requests"], 3)
+        else:
+            entry["reuse_rate"] = 0.0
+    return stats
+
+
+def log_pool_stats():
+    stats = get_pool_stats()
+    total_requests = sum(s["requests"] for s in stats.values())
+    total_connections = sum(s["connections"] for s in stats.values())
+    if not total_requests:
+        return
+    reuse = 1 - total_connections / total_requests
+    lh.log(f"HTTP pool: {total_requests} requests over {total_connections} connections to {len(stats)} hosts (reuse {reuse:.0%})", "log")
+    for host, entry in sorted(stats.items(), key=lambda item: item[1]["requests"], reverse=True):
+        lh.log(f"  {host}: {entry['requests']} requests, {entry['connections']} connections (reuse {entry['reuse_rate']:.0%})", "log")
@@ -0,0 +1,134 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Shared by the coordinating bot and every ScanWorker, the SCAN_QUEUE_PATH environment
+# variable can point it at a location all machines can reach. The file uses SQLite's
+# rollback journal rather than WAL because WAL needs shared memory, which doesn't
+# work across machines.
+QUEUE_PATH = "data/scan_queue.db"
+# A leased job goes back to the queue when its worker stops renewing it this long
+LEASE_SECONDS = 120
+# Jobs that failed on this many leases are given up
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    batch TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created);
+CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs(batch);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def get_connection():
+    """Return this thread's connection to the queue, creating the schema on first use."""
+    path = os.getenv("SCAN_QUEUE_PATH", QUEUE_PATH)
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Transactions are opened explicitly so leasing can take the write lock up front
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        connections[path] = conn
+    if path not in _initialized:
+        with _init_lock:
+            if path not in _initialized:
+                conn.executescript(SCHEMA)
+                _initialized.add(path)
+    return conn
+
+
+def _write(conn, statements):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = statements(conn)
+        conn.execute("COMMIT")
+        return result
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def enqueue(batch, payloads):
+    """Queue one job per JSON-serializable payload and return their ids in the same order."""
+    now = time.time()
+    job_ids = [uuid.uuid4().hex for _ in payloads]
+    _write(get_connection(), lambda conn: conn.executemany(
+        "INSERT INTO jobs (id, batch, payload, created) VALUES (?, ?, ?, ?)",
+        [(job_id, batch, json.dumps(payload), now) for job_id, payload in zip(job_ids, payloads)],
+    ))
+    return job_ids
+
+
+def lease(worker, limit=1, lease_seconds=LEASE_SECONDS):
+    """Take up to limit queued or abandoned jobs for worker, returns [(job_id, payload)]."""
+    now = time.time()
+
+    def take(conn):
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', result = NULL, worker = NULL "
+            "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+            (now, MAX_ATTEMPTS),
+        )
+        rows = conn.execute(
+            "SELECT id, payload FROM jobs WHERE status = 'queued' OR (status = 'leased' AND lease_until < ?) "
+            "ORDER BY created LIMIT ?",
+            (now, limit),
+        ).fetchall()
+        conn.executemany(
+            "UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+            [(worker, now + lease_seconds, row["id"]) for row in rows],
+        )
+        return [(row["id"], json.loads(row["payload"])) for row in rows]
+
+    return _write(get_connection(), take)
+
+
+def renew(job_ids, worker, lease_seconds=LEASE_SECONDS):
+    """Extend the leases worker still holds on job_ids."""
+    until = time.time() + lease_seconds
+    _write(get_connection(), lambda conn: conn.executemany(
+        "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+        [(until, job_id, worker) for job_id in job_ids],
+    ))
+
+
+def complete(job_id, worker, result):
+    """Store a job's JSON-serializable result, ignored if the lease was lost to another worker."""
+    cursor = _write(get_connection(), lambda conn: conn.execute(
+        "UPDATE jobs SET status = 'done', result = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+        (json.dumps(result), job_id, worker),
+    ))
+    return cursor.rowcount == 1
+
+
+def get_results(batch):
+    """{job_id: result} of the batch's finished jobs, None for jobs given up after MAX_ATTEMPTS."""
+    rows = get_connection().execute(
+        "SELECT id, status, result FROM jobs WHERE batch = ? AND status IN ('done', 'failed')", (batch,)
+    ).fetchall()
+    return {row["id"]: json.loads(row["result"]) if row["status"] == "done" else None for row in rows}
+
+
+def forget(batch):
+    """Drop every job of a batch, queued ones are never picked up."""
+    _write(get_connection(), lambda conn: conn.execute("DELETE FROM jobs WHERE batch = ?", (batch,)))
@@ -0,0 +1,115 @@
+import re
+import time
+import JsonHandler
+import LogHandler as lh
+import StructuredData
+from AutoDetectPrice import get_domain
+
+# How often a JS page is re-tried over plain HTTP, faster for domains where HTTP usually works
+PROBE_INTERVAL = 24 * 3600
+FAST_PROBE_INTERVAL = 3600
+FAST_PROBE_SUCCESS_RATE = 0.8
+# Consecutive successful HTTP probes before trackers are switched to plain HTTP
+DEMOTE_AFTER = 2
+# Minimum time between Selenium probes for a plain HTTP page whose selectors stopped matching
+PROMOTE_PROBE_INTERVAL = 6 * 3600
+MIN_SAMPLES = 3
+
+PRICE_DIGIT_RE = re.compile(r'\d')
+
+
+def page_key(page):
+    return "page:" + page.get('key', page['url'])
+
+
+def domain_key(page):
+    return "domain:" + get_domain(page['url'])
+
+
+def http_success_rate(stats):
+    total = stats["http_ok"] + stats["http_fail"]
+    if total < MIN_SAMPLES:
+        return None
+    return stats["http_ok"] / total
+
+
+def should_probe_http(page):
+    """True if a JS page is due for a cheap plain HTTP attempt before launching Selenium."""
+    stats = JsonHandler.get_route_stats(page_key(page))
+    rate = http_success_rate(JsonHandler.get_route_stats(domain_key(page)))
+    interval = FAST_PROBE_INTERVAL if rate is not None and rate >= FAST_PROBE_SUCCESS_RATE else PROBE_INTERVAL
+    last_probe = stats["last_http_probe"]
+    return last_probe is None or time.time() - last_probe >= interval
+
+
+def has_structured_price(page):
+    """True if the last plain HTTP fetch of a JS page carried a structured data price."""
+    cache = JsonHandler.get_page_cache(page.get('key', page['url']))
+    return bool(cache and cache["selector_texts"].get(StructuredData.STRUCTURED_SELECTOR))
+
+
+def texts_have_prices(texts, selectors):
+    return all(texts.get(selector) and PRICE_DIGIT_RE.search(texts[selector]) for selector in selectors)
+
+
+def _set_trackers_js(entries, js, batch):
+    tracker_uuids = [e['tracker']['uuid'] for e in entries]
+    if batch is not None:
+        batch.set_trackers_js(tracker_uuids, js)
+    else:
+        JsonHandler.update_trackers_js(tracker_uuids, js)
+
+
+def record_http_probe(page, texts, batch=None):
+    """Record a plain HTTP probe of a JS page, returns True if it found every tracker's price.
+
+    After DEMOTE_AFTER successes in a row the JS trackers on the page are switched to plain HTTP,
+    through batch when given.
+    """
+    ok = texts_have_prices(texts, page['selectors'])
+    JsonHandler.record_route_result([page_key(page), domain_key(page)], "http", ok)
+    if not ok:
+        lh.log(f"Plain HTTP probe for {page['url']} missed a selector, keeping Selenium", "log")
+        return False
+    lh.log(f"Plain HTTP probe for {page['url']} found all prices, skipping Selenium", "success")
+    stats = JsonHandler.get_route_stats(page_key(page))
+    if stats["http_streak"] >= DEMOTE_AFTER:
+        js_entries = [e for e in page['entries'] if e['tracker'].get('js', False)]
+        if js_entries:
+            _set_trackers_js(js_entries, False, batch)
+            lh.log(f"Switched {len(js_entries)} tracker(s) on {page['url']} to plain HTTP", "success")
+    return True
+
+
+def record_http_failure(page, probe):
+    """Record a plain HTTP attempt of a JS page that failed to fetch, e.g. a 403 for non-browser clients.
+
+    The cached plain HTTP results are dropped, so a structured data price found
+    earlier doesn't make every scan try plain HTTP again before the next probe.
+    """
+    if probe:
+        JsonHandler.record_route_result([page_key(page), domain_key(page)], "http", False)
+    JsonHandler.delete_page_cache(page.get('key', page['url']))
+
+
+def should_probe_js(page, texts):
+    """True if a plain HTTP page missed a tracker selector and may need JS rendering."""
+    if texts_have_prices(texts, page['selectors']):
+        return False
+    stats = JsonHandler.get_route_stats(page_key(page))
+    last_probe = stats["last_js_probe"]
+    return last_probe is None or time.time() - last_probe >= PROMOTE_PROBE_INTERVAL
+
+
+def record_js_probe(page, http_texts, js_texts, batch=None):
+    """Record a Selenium probe of a plain HTTP page and switch trackers that only work with JS."""
+    promote = [
+        e for e in page['entries']
+        if not http_texts.get(e['tracker']['selector']) and js_texts.get(e['tracker']['selector'])
+    ]
+    JsonHandler.record_route_result([page_key(page), domain_key(page)], "js", bool(promote))
+    if promote:
+        JsonHandler.record_route_result([page_key(page), domain_key(page)], "http", False)
+        _set_trackers_js(promote, True, batch)
+        lh.log(f"Switched {len(promote)} tracker(s) on {page['url']} to Selenium rendering", "warn")
+    return bool(promote)
@@ -1,22 +1,589 @@
+import copy
+import glob
 import json
 import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 import LogHandler as lh
 import uuid
+import random
 
 CONFIG_PATH = "config/guild_config.json"
 path_dataJson = "data/data.json"
 path_selectorDataJson = "data/selector_data.json"
 debug_json_path = "data/debug_data.json"
 USER_PERMS_PATH = "data/user_perms.json"
+DB_PATH = "data/data.db"
+DEBUG_DB_PATH = "data/debug_data.db"
+# ScanWorker processes keep their route stats and page cache here, apart from the bot's database
+WORKER_DB_PATH = "data/worker_data.db"
 MAX_GLOBAL_TRACKERS_PER_GUILD = 20
 DEFAULT_TRACKER_LIMIT = 5 
+# Seconds between mtime checks of cached files, writes through this module invalidate immediately
+CACHE_CHECK_INTERVAL = 2
+
+
+class CachedJsonFile:
+    """Parsed JSON file kept in memory and reloaded only when its mtime or size changes."""
+
+    def __init__(self, path, default=dict, encoding=None):
+        self.path = path
+        self.default = default
+        self.encoding = encoding
+        self._data = None
+        self._key = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._data is not None and now - self._checked < CACHE_CHECK_INTERVAL:
+                return self._data
+            self._checked = now
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                self._data = self.default()
+                self._key = None
+                return self._data
+            key = (stat.st_mtime_ns, stat.st_size)
+            if self._data is None or key != self._key:
+                with open(self.path, "r", encoding=self.encoding) as f:
+                    self._data = json.load(f)
+                self._key = key
+            return self._data
+
+    def save(self, data):
+        with self._lock:
+            with open(self.path, "w", encoding=self.encoding) as f:
+                json.dump(data, f, indent=2)
+            stat = os.stat(self.path)
+            self._data = data
+            self._key = (stat.st_mtime_ns, stat.st_size)
+            self._checked = time.monotonic()
+
+
+# Trackers live in SQLite (WAL mode) with the same layout as the old data.json:
+# scope is 'global' (owner_id = guild id) or 'user' (owner_id = user id).
+TRACKER_COLUMNS = ("id", "uuid", "name", "url", "selector", "currentPrice", "js")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trackers (
+    pk INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    owner_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    uuid TEXT,
+    name TEXT,
+    url TEXT,
+    selector TEXT,
+    currentPrice TEXT,
+    js INTEGER,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trackers_owner ON trackers(scope, owner_id, id);
+CREATE INDEX IF NOT EXISTS idx_trackers_id ON trackers(id);
+CREATE INDEX IF NOT EXISTS idx_trackers_uuid ON trackers(uuid);
+CREATE INDEX IF NOT EXISTS idx_trackers_url ON trackers(url);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS page_cache (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    body_hash TEXT,
+    selector_texts TEXT,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS route_stats (
+    key TEXT PRIMARY KEY,
+    http_ok INTEGER NOT NULL DEFAULT 0,
+    http_fail INTEGER NOT NULL DEFAULT 0,
+    js_ok INTEGER NOT NULL DEFAULT 0,
+    js_fail INTEGER NOT NULL DEFAULT 0,
+    http_streak INTEGER NOT NULL DEFAULT 0,
+    last_http_probe REAL,
+    last_js_probe REAL
+);
+CREATE TABLE IF NOT EXISTS scan_schedule (
+    key TEXT PRIMARY KEY,
+    next_due REAL NOT NULL,
+    interval REAL NOT NULL,
+    last_scan REAL,
+    min_interval REAL,
+    max_interval REAL,
+    last_change REAL
+);
+CREATE INDEX IF NOT EXISTS idx_scan_schedule_due ON scan_schedule(next_due);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+guild_config_cache = CachedJsonFile(CONFIG_PATH)
+selector_data_cache = CachedJsonFile(path_selectorDataJson, encoding="utf-8")
+user_perms_cache = CachedJsonFile(USER_PERMS_PATH)
+
+_tracker_cache_lock = threading.Lock()
+_tracker_cache = {"key": None, "checked": 0, "snapshot": None}
+_tracker_generation = 0
+_store_path = None
+
+
+def use_store(path):
+    """Make path the database of this process, so a ScanWorker never opens or replays the bot's."""
+    global _store_path
+    _store_path = path
+
+
+def get_active_db_path():
+    if _store_path is not None:
+        return _store_path
+    if os.path.exists(DEBUG_DB_PATH):
+        return DEBUG_DB_PATH
+    return DB_PATH
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def get_connection():
+    """Return this thread's connection to the active tracker database, creating it on first use."""
+    path = get_active_db_path()
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = _connect(path)
+        connections[path] = conn
+    if path not in _initialized:
+        with _init_lock:
+            if path not in _initialized:
+                # Only the bot's own databases import trackers from data.json
+                json_path = {DB_PATH: path_dataJson, DEBUG_DB_PATH: debug_json_path}.get(path, "")
+                init_store(conn, path, json_path)
+                _initialized.add(path)
+    return conn
+
+
+# Columns added to existing tables after their first release
+ADDED_COLUMNS = {
+    "scan_schedule": {"min_interval": "REAL", "max_interval": "REAL", "last_change": "REAL"},
+}
+
+
+def init_store(conn, db_path, json_path):
+    conn.executescript(SCHEMA)
+    for table, columns in ADDED_COLUMNS.items():
+        present = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+        for column, column_type in columns.items():
+            if column not in present:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    migrated = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+    if migrated is None:
+        migrate_from_json(conn, json_path)
+    # Scan results and schedules are keyed by uuid, trackers from old data.json files have none
+    missing = conn.execute("SELECT rowid FROM trackers WHERE uuid IS NULL").fetchall()
+    if missing:
+        with conn:
+            conn.executemany("UPDATE trackers SET uuid = ? WHERE rowid = ?", [(str(uuid.uuid4()), row["rowid"]) for row in missing])
+    replay_scan_journals(conn, db_path)
+
+
+def migrate_from_json(conn, json_path):
+    """One-shot import of the old data.json layout into the tracker table."""
+    data = {}
+    if os.path.exists(json_path):
+        with open(json_path, "r") as file:
+            data = json.load(file)
+    count = 0
+    with conn:
+        for guild_id, trackers in data.get('global', {}).items():
+            for tracker in trackers:
+                _insert_tracker(conn, 'global', guild_id, tracker)
+                count += 1
+        for user_id, trackers in data.get('users', {}).items():
+            for tracker in trackers:
+                _insert_tracker(conn, 'user', user_id, tracker)
+                count += 1
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)", (json_path,))
+    if count:
+        lh.log(f"Migrated {count} trackers from {json_path} to the tracker database", "success")
+
+
+def _insert_tracker(conn, scope, owner_id, tracker):
+    extra = {k: v for k, v in tracker.items() if k not in TRACKER_COLUMNS}
+    js = tracker.get('js')
+    conn.execute(
+        "INSERT INTO trackers (scope, owner_id, id, uuid, name, url, selector, currentPrice, js, extra) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            scope, str(owner_id), tracker['id'], tracker.get('uuid') or str(uuid.uuid4()), tracker.get('name'), tracker.get('url'),
+            tracker.get('selector'), tracker.get('currentPrice'), None if js is None else int(bool(js)),
+            json.dumps(extra) if extra else None,
+        ),
+    )
+
+
+def _row_to_tracker(row):
+    tracker = {}
+    for column in TRACKER_COLUMNS:
+        value = row[column]
+        if value is None and column in ("uuid", "js"):
+            continue
+        tracker[column] = bool(value) if column == "js" else value
+    if row["extra"]:
+        tracker.update(json.loads(row["extra"]))
+    return tracker
+
+
+def invalidate_tracker_cache():
+    global _tracker_generation
+    with _tracker_cache_lock:
+        _tracker_generation += 1
+
+
+@contextmanager
+def _transaction():
+    """Run writes in one transaction and drop the cached tracker snapshot afterwards."""
+    conn = get_connection()
+    try:
+        with conn:
+            yield conn
+    finally:
+        invalidate_tracker_cache()
+
+
+def _db_file_key(path):
+    key = []
+    for file_path in (path, path + "-wal"):
+        try:
+            stat = os.stat(file_path)
+            key.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            key.append(None)
+    return tuple(key)
+
+
+def _tracker_snapshot():
+    """Return all trackers grouped by (scope, owner_id), cached until a write or a database file change."""
+    conn = get_connection()
+    path = get_active_db_path()
+    with _tracker_cache_lock:
+        now = time.monotonic()
+        snapshot = _tracker_cache["snapshot"]
+        key = _tracker_cache["key"]
+        if snapshot is not None and key[:2] == (path, _tracker_generation) and now - _tracker_cache["checked"] < CACHE_CHECK_INTERVAL:
+            return snapshot
+        _tracker_cache["checked"] = now
+        key = (path, _tracker_generation, _db_file_key(path))
+        if snapshot is not None and key == _tracker_cache["key"]:
+            return snapshot
+        owners = {}
+        rows = []
+        for row in conn.execute("SELECT * FROM trackers ORDER BY pk").fetchall():
+            tracker = _row_to_tracker(row)
+            owners.setdefault((row["scope"], row["owner_id"]), []).append(tracker)
+            rows.append((row["scope"], row["owner_id"], tracker))
+        snapshot = {"owners": owners, "rows": rows}
+        _tracker_cache["snapshot"] = snapshot
+        _tracker_cache["key"] = key
+        return snapshot
+
+
+def _cached_trackers(scope, owner_id):
+    return [dict(t) for t in _tracker_snapshot()["owners"].get((scope, str(owner_id)), [])]
+
+
+def get_page_cache(url):
+    """Return the stored HTTP validators, body hash and last selector results for a page, or None."""
+    row = get_connection().execute("SELECT * FROM page_cache WHERE url = ?", (url,)).fetchone()
+    if row is None:
+        return None
+    return {
+        "etag": row["etag"],
+        "last_modified": row["last_modified"],
+        "body_hash": row["body_hash"],
+        "selector_texts": json.loads(row["selector_texts"]) if row["selector_texts"] else {},
+    }
+
+
+def save_page_cache(url, etag, last_modified, body_hash, selector_texts):
+    # Page cache rows are not tracker data, so this skips the tracker cache invalidation
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO page_cache (url, etag, last_modified, body_hash, selector_texts, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, body_hash, json.dumps(selector_texts), time.time()),
+        )
+
+
+def delete_page_cache(url):
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM page_cache WHERE url = ?", (url,))
+
+
+def get_route_stats(key):
+    """Return plain HTTP vs JS render success counts for a page or domain key."""
+    row = get_connection().execute("SELECT * FROM route_stats WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return {"http_ok": 0, "http_fail": 0, "js_ok": 0, "js_fail": 0, "http_streak": 0, "last_http_probe": None, "last_js_probe": None}
+    return dict(row)
+
+
+def record_route_result(keys, mode, ok):
+    """Count a plain HTTP ('http') or rendered ('js') attempt for each key."""
+    column = f"{mode}_ok" if ok else f"{mode}_fail"
+    probe_column = "last_http_probe" if mode == "http" else "last_js_probe"
+    if mode == "http":
+        streak = "http_streak + 1" if ok else "0"
+    else:
+        streak = "http_streak"
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        for key in keys:
+            conn.execute("INSERT OR IGNORE INTO route_stats (key) VALUES (?)", (key,))
+            conn.execute(
+                f"UPDATE route_stats SET {column} = {column} + 1, http_streak = {streak}, {probe_column} = ? WHERE key = ?",
+                (now, key),
+            )
+
+
+def schedule_key(tracker_uuid, guild_id=None, user_id=None):
+    """Scan schedule key of a global (guild) or private (user) tracker.
+
+    Trackers are keyed by uuid since ids are reused after a removal, the owner prefix
+    lets a guild's schedules be looked up together.
+    """
+    if guild_id is not None:
+        return f"global:{guild_id}:{tracker_uuid}"
+    return f"user:{user_id}:{tracker_uuid}"
+
+
+def sync_scan_schedule(bounds):
+    """Make the scan schedule match {key: (base interval, min interval, max interval)} in seconds.
+
+    New keys start at their base interval with a random first due time within it so
+    scans spread out, keys that are gone are dropped and changed bounds apply right away.
+    """
+    now = time.time()
+    conn = get_connection()
+    existing = {row["key"]: row for row in conn.execute("SELECT * FROM scan_schedule").fetchall()}
+    inserts = []
+    updates = []
+    for key, (base, min_interval, max_interval) in bounds.items():
+        row = existing.get(key)
+        if row is None:
+            inserts.append((key, now + random.uniform(0, base), base, min_interval, max_interval))
+            continue
+        if (row["min_interval"], row["max_interval"]) != (min_interval, max_interval):
+            interval = min(max_interval, max(min_interval, row["interval"]))
+            last_scan = row["last_scan"] if row["last_scan"] is not None else now
+            updates.append((min(row["next_due"], last_scan + interval), interval, min_interval, max_interval, key))
+    removed = [(key,) for key in existing if key not in bounds]
+    if not (inserts or updates or removed):
+        return
+    with conn:
+        conn.executemany(
+            "INSERT INTO scan_schedule (key, next_due, interval, min_interval, max_interval) VALUES (?, ?, ?, ?, ?)",
+            inserts,
+        )
+        conn.executemany(
+            "UPDATE scan_schedule SET next_due = ?, interval = ?, min_interval = ?, max_interval = ? WHERE key = ?",
+            updates,
+        )
+        conn.executemany("DELETE FROM scan_schedule WHERE key = ?", removed)
+
+
+def get_due_scans(until, limit=None):
+    """Return [(key, next_due)] due at or before until, earliest first."""
+    query = "SELECT key, next_due FROM scan_schedule WHERE next_due <= ? ORDER BY next_due"
+    params = (until,)
+    if limit is not None:
+        query += " LIMIT ?"
+        params = (until, limit)
+    return [(row["key"], row["next_due"]) for row in get_connection().execute(query, params).fetchall()]
+
+
+def get_scan_schedule(keys):
+    """Return {key: schedule row as a dict} for the given keys."""
+    conn = get_connection()
+    rows = {}
+    for key in keys:
+        row = conn.execute("SELECT * FROM scan_schedule WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            rows[key] = dict(row)
+    return rows
+
+
+def get_scan_intervals(prefix):
+    """Return the current interval of every schedule key starting with prefix."""
+    rows = get_connection().execute(
+        "SELECT interval FROM scan_schedule WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+    ).fetchall()
+    return [row["interval"] for row in rows]
+
+
+def update_scan_schedule(updates):
+    """Store scan outcomes, updates are (key, interval, next_due, last_scan, last_change)."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE scan_schedule SET interval = ?, next_due = ?, last_scan = ?, "
+            "last_change = COALESCE(?, last_change) WHERE key = ?",
+            [(interval, next_due, last_scan, last_change, key) for key, interval, next_due, last_scan, last_change in updates],
+        )
+
+
+# For switching trackers between plain HTTP and Selenium, given by uuid
+def update_trackers_js(tracker_uuids, js):
+    try:
+        with _transaction() as conn:
+            conn.executemany(
+                "UPDATE trackers SET js = ? WHERE uuid = ?",
+                [(int(bool(js)), tracker_uuid) for tracker_uuid in tracker_uuids],
+            )
+    except Exception as e:
+        lh.log(f"Error updating js flag for trackers: {e}", "error")
+
+
+def create_debug_store():
+    """Copy the live tracker database so DEBUG runs never touch real prices."""
+    if os.path.exists(DEBUG_DB_PATH):
+        return
+    source = get_connection()
+    target = sqlite3.connect(DEBUG_DB_PATH)
+    with target:
+        source.backup(target)
+    target.close()
+
+
+def remove_debug_store():
+    paths = [DEBUG_DB_PATH, DEBUG_DB_PATH + "-wal", DEBUG_DB_PATH + "-shm", debug_json_path]
+    paths += glob.glob(DEBUG_DB_PATH + ".scan-*.journal")
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _apply_scan_results(conn, prices, selectors):
+    """Write collected prices and healed selectors, keyed by tracker uuid.
+
+    A tracker removed during the scan is skipped, even if its id was given to a new one.
+    """
+    conn.executemany(
+        "UPDATE trackers SET currentPrice = ? WHERE uuid = ?",
+        [(price, tracker_uuid) for tracker_uuid, price in prices.items()],
+    )
+    conn.executemany(
+        "UPDATE trackers SET selector = ? WHERE uuid = ?",
+        [(selector, tracker_uuid) for tracker_uuid, selector in selectors.items()],
+    )
+
+
+def _read_scan_journal(journal_path):
+    prices = {}
+    selectors = {}
+    with open(journal_path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Last line may be half written if the process died mid-append
+                continue
+            if record["type"] == "price":
+                prices[record["uuid"]] = record["value"]
+            elif record["type"] == "selector":
+                selectors[record["uuid"]] = record["value"]
+    return prices, selectors
+
+
+def replay_scan_journals(conn, db_path):
+    """Apply results of scans that crashed before their batch was committed."""
+    for journal_path in sorted(glob.glob(db_path + ".scan-*.journal")):
+        try:
+            prices, selectors = _read_scan_journal(journal_path)
+            with conn:
+                _apply_scan_results(conn, prices, selectors)
+            invalidate_tracker_cache()
+            os.remove(journal_path)
+            lh.log(f"Recovered {len(prices)} prices from unfinished scan journal {journal_path}", "warn")
+        except Exception as e:
+            lh.log(f"Error replaying scan journal {journal_path}: {e}", "error")
+
+
+class ScanBatch:
+    """Write-behind buffer for one scan cycle.
+
+    Results are kept in memory and committed in a single transaction by
+    commit(). Each result is appended to a journal file first, so a crash in
+    the middle of a scan is recovered on the next start.
+    """
+
+    def __init__(self):
+        get_connection()
+        self.db_path = get_active_db_path()
+        self.journal_path = f"{self.db_path}.scan-{uuid.uuid4().hex[:12]}.journal"
+        self.prices = {}
+        self.selectors = {}
+        self._lock = threading.Lock()
+        self._journal = None
+
+    def _append(self, record):
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(json.dumps(record) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            if record["type"] == "price":
+                self.prices[record["uuid"]] = record["value"]
+            else:
+                self.selectors[record["uuid"]] = record["value"]
+
+    def add_price(self, tracker_uuid, new_price):
+        self._append({"type": "price", "uuid": tracker_uuid, "value": new_price})
+
+    def add_selector(self, tracker_uuid, selector):
+        self._append({"type": "selector", "uuid": tracker_uuid, "value": selector})
+
+    def set_trackers_js(self, tracker_uuids, js):
+        """Switch trackers between plain HTTP and Selenium, written at once like outside a scan."""
+        update_trackers_js(tracker_uuids, js)
+
+    def commit(self):
+        with self._lock:
+            if self.prices or self.selectors:
+                with _transaction() as conn:
+                    _apply_scan_results(conn, self.prices, self.selectors)
+                lh.log(f"Committed {len(self.prices)} prices and {len(self.selectors)} selectors in one transaction", "log")
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+            self.prices = {}
+            self.selectors = {}
 
 
 # Helper: get per-user tracker limit, using exceptions in user_perms.json
 def get_user_tracker_limit(user_id):
     try:
-        with open(USER_PERMS_PATH, "r") as file:
-            perms = json.load(file)
+        perms = user_perms_cache.get()
         return perms.get("user_limits", {}).get(str(user_id), DEFAULT_TRACKER_LIMIT)
     except Exception:
         return DEFAULT_TRACKER_LIMIT
@@ -30,93 +597,70 @@ def addUserTracker(user_id, new_tracker):
     user_id = str(user_id)
     if is_user_banned(user_id):
         return False
-    with open(get_active_json_path(), 'r') as file:
-        data = json.load(file)
-    users = data.setdefault('users', {})
-    user_tracks = users.setdefault(user_id, [])
     limit = get_user_tracker_limit(user_id)
-    if len(user_tracks) >= limit:
-        return False
-    all_ids = [t['id'] for t in user_tracks]
-    new_id = max(all_ids) + 1 if all_ids else 1
-    new_tracker['id'] = new_id
-    new_tracker['uuid'] = str(uuid.uuid4())
-    user_tracks.append(new_tracker)
-    with open(get_active_json_path(), 'w') as file:
-        json.dump(data, file, indent=2)
+    with _transaction() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*), MAX(id) FROM trackers WHERE scope = 'user' AND owner_id = ?", (user_id,)
+        ).fetchone()
+        if row[0] >= limit:
+            return False
+        new_tracker['id'] = (row[1] or 0) + 1
+        new_tracker['uuid'] = str(uuid.uuid4())
+        _insert_tracker(conn, 'user', user_id, new_tracker)
     return True
 
 def get_all_user_ids():
-    with open(get_active_json_path(), "r") as file:
-        data = json.load(file)
-    return list(data.get('users', {}).keys())
+    owners = _tracker_snapshot()["owners"]
+    return sorted(owner_id for scope, owner_id in owners if scope == 'user')
 
-def get_active_json_path():
-    if os.path.exists(debug_json_path):
-        return debug_json_path
-    return path_dataJson
+# Read-only view of the cached guild config, use load_guild_config to modify
+def get_guild_config():
+    return guild_config_cache.get()
 
 def load_guild_config():
-    if not os.path.exists(CONFIG_PATH):
-        return {}
-    with open(CONFIG_PATH, "r") as f:
-        return json.load(f)
+    return copy.deepcopy(guild_config_cache.get())
 
 def save_guild_config(config):
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(config, f, indent=2)
+    guild_config_cache.save(config)
 
 def load_selector_data():
-    if not os.path.exists(path_selectorDataJson):
-        return {}
-    with open(path_selectorDataJson, "r") as f:
-        return json.load(f)
+    return copy.deepcopy(selector_data_cache.get())
 
 def save_selector_data(data):
-    with open(path_selectorDataJson, "w") as f:
-        json.dump(data, f, indent=2)
+    selector_data_cache.save(data)
 
 # Get all trackers (global or user)
 def getAllJsonData(guild_id=None):
-    with open(get_active_json_path(), "r") as file:
-        data = json.load(file)
     if guild_id is None:
         # Return all user trackers as a flat list
-        all_tracks = []
-        for user_tracks in data.get('users', {}).values():
-            all_tracks.extend(user_tracks)
-        return all_tracks
+        return [dict(t) for scope, owner_id, t in _tracker_snapshot()["rows"] if scope == 'user']
     else:
         guild_id = str(guild_id)
-        return data.get('global', {}).get(guild_id, [])
+        return _cached_trackers('global', guild_id)
 
 # For showMyTracks
 def getUserTrackers(user_id):
     user_id = str(user_id)
-    with open(get_active_json_path(), "r") as file:
-        data = json.load(file)
-    return data.get('users', {}).get(user_id, [])
+    return _cached_trackers('user', user_id)
+
+# Find which user owns a private tracker id
+def getUserTrackerOwner(id):
+    for scope, owner_id, tracker in _tracker_snapshot()["rows"]:
+        if scope == 'user' and tracker['id'] == id:
+            return owner_id
+    return None
 
 # For removing a user tracker
 def removeUserTracker(user_id, id):
     user_id = str(user_id)
-    with open(get_active_json_path(), 'r') as file:
-        data = json.load(file)
-    users = data.get('users', {})
-    user_tracks = users.get(user_id, [])
-    initial_len = len(user_tracks)
-    user_tracks = [t for t in user_tracks if t['id'] != id]
-    users[user_id] = user_tracks
-    with open(get_active_json_path(), 'w') as file:
-        json.dump(data, file, indent=2)
-    return len(user_tracks) < initial_len
+    with _transaction() as conn:
+        cursor = conn.execute("DELETE FROM trackers WHERE scope = 'user' AND owner_id = ? AND id = ?", (user_id, id))
+    return cursor.rowcount > 0
 
 # For getting a global tracker object by id
 def getObject(id, guild_id):
     try:
-        with open(get_active_json_path(), 'r') as file:
-            data = json.load(file)
-        for site in data.get('global', {}).get(guild_id, []):
+        for site in _cached_trackers('global', guild_id):
             if site['id'] == id:
                 return site
         lh.log(f"No site found with ID {id} in guild {guild_id}", "warn")
@@ -128,32 +672,40 @@ def getObject(id, guild_id):
 # For updating a global tracker price
 def update_site_price(site_id, new_price, guild_id):
     try:
-        with open(get_active_json_path(), 'r') as file:
-            data = json.load(file)
-        for site in data.get('global', {}).get(guild_id, []):
-            if site['id'] == site_id:
-                site['currentPrice'] = new_price
-                break
-        with open(get_active_json_path(), 'w') as file:
-            json.dump(data, file, indent=2)
+        with _transaction() as conn:
+            conn.execute(
+                "UPDATE trackers SET currentPrice = ? WHERE scope = 'global' AND owner_id = ? AND id = ?",
+                (new_price, str(guild_id), site_id),
+            )
     except Exception as e:
-        lh.log(f"Error updating price in JSON file: {e}", "error")
+        lh.log(f"Error updating price in tracker database: {e}", "error")
+
+# For replacing a broken selector with a working one
+def update_tracker_selector(tracker_id, selector, guild_id=None, user_id=None):
+    scope = 'global' if guild_id is not None else 'user'
+    owner_id = str(guild_id if guild_id is not None else user_id)
+    try:
+        with _transaction() as conn:
+            conn.execute(
+                "UPDATE trackers SET selector = ? WHERE scope = ? AND owner_id = ? AND id = ?",
+                (selector, scope, owner_id, tracker_id),
+            )
+    except Exception as e:
+        lh.log(f"Error updating selector for tracker {tracker_id}: {e}", "error")
 
 # For adding a global tracker
 def addTracker(new_tracker, guild_id):
     try:
-        with open(get_active_json_path(), 'r') as file:
-            data = json.load(file)
-        global_trackers = data.setdefault('global', {})
-        guild_trackers = global_trackers.setdefault(guild_id, [])
-        if len(guild_trackers) >= MAX_GLOBAL_TRACKERS_PER_GUILD:
-            return False
-        new_id = max([site['id'] for site in guild_trackers], default=0) + 1
-        new_tracker['id'] = new_id
-        new_tracker['uuid'] = str(uuid.uuid4())
-        guild_trackers.append(new_tracker)
-        with open(get_active_json_path(), 'w') as file:
-            json.dump(data, file, indent=2)
+        guild_id = str(guild_id)
+        with _transaction() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MAX(id) FROM trackers WHERE scope = 'global' AND owner_id = ?", (guild_id,)
+            ).fetchone()
+            if row[0] >= MAX_GLOBAL_TRACKERS_PER_GUILD:
+                return False
+            new_tracker['id'] = (row[1] or 0) + 1
+            new_tracker['uuid'] = str(uuid.uuid4())
+            _insert_tracker(conn, 'global', guild_id, new_tracker)
         return True
     except Exception as e:
         lh.log(f"Error adding tracker: {e}", "error")
@@ -162,48 +714,33 @@ def addTracker(new_tracker, guild_id):
 # For removing a global tracker
 def removeTracker(id, guild_id):
     try:
-        with open(get_active_json_path(), 'r') as file:
-            data = json.load(file)
-        guild_trackers = data.get('global', {}).get(guild_id, [])
-        data['global'][guild_id] = [site for site in guild_trackers if site['id'] != id]
-        with open(get_active_json_path(), 'w') as file:
-            json.dump(data, file, indent=2)
+        with _transaction() as conn:
+            conn.execute("DELETE FROM trackers WHERE scope = 'global' AND owner_id = ? AND id = ?", (str(guild_id), id))
     except Exception as e:
         lh.log(f"Error removing tracker: {e}", "error")
 
 def update_user_tracker_price(user_id, site_id, new_price):
     user_id = str(user_id)
     try:
-        with open(get_active_json_path(), 'r') as file:
-            data = json.load(file)
-        user_tracks = data.get('users', {}).get(user_id, [])
-        for tracker in user_tracks:
-            if tracker['id'] == site_id:
-                tracker['currentPrice'] = new_price
-                break
-        with open(get_active_json_path(), 'w') as file:
-            json.dump(data, file, indent=2)
+        with _transaction() as conn:
+            conn.execute(
+                "UPDATE trackers SET currentPrice = ? WHERE scope = 'user' AND owner_id = ? AND id = ?",
+                (new_price, user_id, site_id),
+            )
     except Exception as e:
         lh.log(f"Error updating user tracker price: {e}", "error")
 
 def get_selector_data():
-    if not os.path.exists(path_selectorDataJson):
-        return {}
-    with open(path_selectorDataJson, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return selector_data_cache.get()
 
 def update_user_tracker_name(user_id, tracker_id, new_name):
     user_id = str(user_id)
     try:
-        with open(get_active_json_path(), 'r') as file:
-            data = json.load(file)
-        user_tracks = data.get('users', {}).get(user_id, [])
-        for tracker in user_tracks:
-            if tracker['id'] == tracker_id:
-                tracker['name'] = new_name
-                break
-        with open(get_active_json_path(), 'w') as file:
-            json.dump(data, file, indent=2)
+        with _transaction() as conn:
+            conn.execute(
+                "UPDATE trackers SET name = ? WHERE scope = 'user' AND owner_id = ? AND id = ?",
+                (new_name, user_id, tracker_id),
+            )
     except Exception as e:
         lh.log(f"Error updating tracker name for user {user_id}, tracker {tracker_id}: {e}", "error")
 
@@ -3,20 +3,22 @@ from discord.ext import commands
 import PriceTracker
 from dotenv import load_dotenv
 import os
-import Scraper
 import JsonHandler
 import LogHandler as lh
 import time
 import validators
 import requests
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 import ipaddress
 import socket
-import shutil
-import json
 import datetime
 import AutoDetectPrice
+import HttpClient
+import DetectionService
+import ScanScheduler
+import CircuitBreaker
+import ParsePool
+import StructuredData
 import asyncio
 
 DEBUG = False
@@ -24,12 +26,10 @@ initialWaitTimeGuild = 1
 initialWaitTimePrivate = 1
 
 if DEBUG:
-    lh.log("Debug mode is enabled. Prices will now be written to the debug json file.", "warn")
-    if not os.path.exists("data/debug_data.json"):
-        shutil.copyfile("data/data.json", "data/debug_data.json")
+    lh.log("Debug mode is enabled. Prices will now be written to the debug tracker database.", "warn")
+    JsonHandler.create_debug_store()
 else:
-    if os.path.exists("data/debug_data.json"):
-        os.remove("data/debug_data.json")
+    JsonHandler.remove_debug_store()
 
 load_dotenv()
 
@@ -38,6 +38,14 @@ try:
 except Exception as e:
     lh.log(f"Error: {e}", "error")
 
+# Scrape on ScanWorker processes instead of in the bot, see ScanWorker.py
+PriceTracker.DISTRIBUTED = os.getenv("DISTRIBUTED_SCANS") == "1"
+if PriceTracker.DISTRIBUTED:
+    lh.log("Distributed scans enabled, pages are scraped by scan workers", "warn")
+
+# Parse workers are forked before discord.py or a scan starts any thread
+ParsePool.start()
+
 
 class Client(commands.Bot):
     async def on_ready(self):
@@ -52,9 +60,16 @@ class Client(commands.Bot):
                 await self.tree.sync(guild=guild)
         except Exception as e:
             lh.log(e, "error")
+        self.guild_channels = {}
         for guild in self.guilds:
             await self.start_guild_tasks(guild)
-        self.loop.create_task(self.private_trackers_task())
+        self.loop.create_task(self.price_check_task())
+
+    async def close(self):
+        DetectionService.shutdown()
+        ParsePool.shutdown()
+        await HttpClient.close_async_session()
+        await super().close()
 
     async def on_guild_join(self, guild):
         guild_id = str(guild.id)
@@ -78,15 +93,14 @@ class Client(commands.Bot):
 
     async def start_guild_tasks(self, guild):
         guild_id = str(guild.id)
-        config = JsonHandler.load_guild_config()
+        config = JsonHandler.get_guild_config()
         channel_id = config.get(guild_id, {}).get("channel_id")
         checkin_interval = config.get(guild_id, {}).get("checkin_interval", 12)
-        scan_interval = config.get(guild_id, {}).get("scan_interval", 1)
         if channel_id:
             channel = self.get_channel(channel_id)
             if channel:
+                self.guild_channels[guild_id] = channel
                 self.loop.create_task(self.guild_checkin_task(guild, channel, checkin_interval))
-                self.loop.create_task(self.guild_price_check_task(guild, channel, scan_interval))
 
     async def guild_checkin_task(self, guild, channel, interval):
         while True:
@@ -98,61 +112,66 @@ class Client(commands.Bot):
             next_run = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=interval)
             await discord.utils.sleep_until(next_run)
 
-    async def guild_price_check_task(self, guild, channel, interval):
-        await asyncio.sleep(initialWaitTimeGuild)
-        while True:
-            lh.log(f"Price check for guild {guild.id}", "log")
-            changed_prices_global = await PriceTracker.CheckGlobalTrackers(DEBUG, str(guild.id), discord_notify=notify_selector_issue)
-            pricewatch_role = discord.utils.get(channel.guild.roles, name="Pricewatch")
-            pricewatch_mention = pricewatch_role.mention if pricewatch_role else "@Pricewatch"
-            if changed_prices_global:
-                if DEBUG:
-                    mention = "Pricewatch"
+    async def send_global_changes(self, channel, changed_prices_global):
+        pricewatch_role = discord.utils.get(channel.guild.roles, name="Pricewatch")
+        pricewatch_mention = pricewatch_role.mention if pricewatch_role else "@Pricewatch"
+        if changed_prices_global:
+            if DEBUG:
+                mention = "Pricewatch"
+            else:
+                mention = pricewatch_mention
+            message_lines = []
+            for price in changed_prices_global:
+                if price is None:
+                    message_lines.append("Price could not be retrieved for one of the items. Item might be sold out.")
+                elif price['New price'] is None:
+                    message_lines.append(f"Name: {price['name']} OLD price: {price['Old price']} --> NEW price: Sold out or selector changed")
                 else:
-                    mention = pricewatch_mention
-                message_lines = []
-                for price in changed_prices_global:
-                    if price is None:
-                        message_lines.append("Price could not be retrieved for one of the items. Item might be sold out.")
-                    elif price['New price'] is None:
-                        message_lines.append(f"Name: {price['name']} OLD price: {price['Old price']} --> NEW price: Sold out or selector changed")
-                    else:
-                        message_lines.append(f"Name: {price['name']} OLD price: {price['Old price']} --> NEW price {price['New price']}")
-                message = f"{mention} - The following global prices have changed:\n" + "\n".join(message_lines)
-                await channel.send(message)
-            next_run = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=interval)
-            await discord.utils.sleep_until(next_run)
+                    message_lines.append(f"Name: {price['name']} OLD price: {price['Old price']} --> NEW price {price['New price']}")
+            message = f"{mention} - The following global prices have changed:\n" + "\n".join(message_lines)
+            await channel.send(message)
+
+    async def send_private_changes(self, changed_prices_private):
+        if changed_prices_private:
+            for price in changed_prices_private:
+                if price is None:
+                    continue
+                user_id = price.get('user_id')
+                if user_id:
+                    try:
+                        user = await self.fetch_user(user_id)
+                        embed = discord.Embed(
+                            title=f"Price Change for '{price['name']}'",
+                            description="Your tracker has detected a price change!",
+                            color=discord.Color.dark_green()
+                        )
+                        embed.add_field(name="Old Price", value=f"**{price['Old price']}**", inline=True)
+                        embed.add_field(name="New Price", value=f"**{price['New price']}**", inline=True)
+                        embed.set_footer(text="Price Watcher Bot")
+                        await user.send(embed=embed)
+                        lh.log(f"DM sent to user_id {user_id}", "success")
+                    except Exception as e:
+                        lh.log(f"Failed to DM user_id {user_id}: {e}", "error")
+                else:
+                    lh.log(f"No user_id found for tracker {price['name']}", "error")
+
+    async def send_scan_changes(self, changed_prices_private, changed_prices_global):
+        await self.send_private_changes(changed_prices_private)
+        for guild_id, changes in changed_prices_global.items():
+            channel = self.guild_channels.get(guild_id)
+            if channel is None:
+                continue
+            try:
+                await self.send_global_changes(channel, changes)
+            except Exception as e:
+                lh.log(f"Failed to send price changes to guild {guild_id}: {e}", "error")
 
-    async def private_trackers_task(self):
-        await asyncio.sleep(initialWaitTimePrivate)
-        interval = 1
-        while True:
-            lh.log("Private tracker scan (single task for all guilds)", "log")
-            changed_prices_private = await PriceTracker.CheckPrivateTrackers(DEBUG, discord_notify=notify_selector_issue)
-            if changed_prices_private:
-                for price in changed_prices_private:
-                    if price is None:
-                        continue
-                    user_id = price.get('user_id')
-                    if user_id:
-                        try:
-                            user = await self.fetch_user(user_id)
-                            embed = discord.Embed(
-                                title=f"Price Change for '{price['name']}'",
-                                description="Your tracker has detected a price change!",
-                                color=discord.Color.dark_green()
-                            )
-                            embed.add_field(name="Old Price", value=f"**{price['Old price']}**", inline=True)
-                            embed.add_field(name="New Price", value=f"**{price['New price']}**", inline=True)
-                            embed.set_footer(text="Price Watcher Bot")
-                            await user.send(embed=embed)
-                            lh.log(f"DM sent to user_id {user_id}", "success")
-                        except Exception as e:
-                            lh.log(f"Failed to DM user_id {user_id}: {e}", "error")
-                    else:
-                        lh.log(f"No user_id found for tracker {price['name']}", "error")
-            next_run = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=interval)
-            await discord.utils.sleep_until(next_run)
+    async def price_check_task(self):
+        """Scan private and guild trackers continuously, each one when its own interval comes due."""
+        await asyncio.sleep(min(initialWaitTimeGuild, initialWaitTimePrivate))
+        await ScanScheduler.run(
+            DEBUG, lambda: list(self.guild_channels), self.send_scan_changes, discord_notify=notify_selector_issue
+        )
 
 class ConfirmPriceView(discord.ui.View):
     def __init__(self, timeout=30):
@@ -178,7 +197,7 @@ intents.message_content = True
 client = Client(command_prefix="/", intents=intents)
 
 def get_guild_setting(guild_id, key, default=None):
-    config = JsonHandler.load_guild_config()
+    config = JsonHandler.get_guild_config()
     return config.get(str(guild_id), {}).get(key, default)
 
 def set_guild_setting(guild_id, key, value, guild_name=None):
@@ -322,25 +341,25 @@ async def addGlobalTracker(interaction: discord.Interaction, name: str, url: str
         return
     await interaction.response.send_message("Auto-detecting price. One moment...")
     msg = await interaction.original_response()
-    if not isValidUrl(url):
+    if not await asyncio.to_thread(isValidUrl, url):
         await msg.edit(content="❌ Invalid URL!")
         return
-    price, selector, js_used = AutoDetectPrice.auto_detect_price(url)
+    try:
+        price, selector, js_used = await DetectionService.detect_price(interaction.user.id, url)
+    except DetectionService.DetectionBusy as e:
+        await msg.edit(content=f"❌ {e}")
+        return
     if price and selector:
         view = ConfirmPriceView()
         await msg.edit(content=f"Is this the correct price for **{name}**? `{price}`", view=view)
         timeout = await view.wait()
         if view.value is True:
-            js_required = True
-            try:
-                if Scraper.selector_works_without_js(url, selector, price):
-                    js_required = False
-            except Exception:
-                pass
-            # Buffer new selector if domain is not in selector_data
+            # Detection already checked the selector against the plain HTML
+            js_required = js_used
+            # Buffer new selector if domain is not in selector_data, structured data isn't a CSS selector
             domain = AutoDetectPrice.get_domain(url)
             selector_data = JsonHandler.get_selector_data()
-            if domain not in selector_data:
+            if domain not in selector_data and selector != StructuredData.STRUCTURED_SELECTOR:
                 JsonHandler.add_selector_to_buffer(domain, selector, js_required)
             new_tracker = {
                 "name": name,
@@ -373,25 +392,25 @@ async def addPrivateTracker(interaction: discord.Interaction, name: str, url: st
     await interaction.response.send_message("Auto-detecting price. One moment...")
     msg = await interaction.original_response()
     user_id = str(interaction.user.id)
-    if not isValidUrl(url):
+    if not await asyncio.to_thread(isValidUrl, url):
         await msg.edit(content="❌ Invalid URL!")
         return
-    price, selector, js_used = AutoDetectPrice.auto_detect_price(url)
+    try:
+        price, selector, js_used = await DetectionService.detect_price(interaction.user.id, url)
+    except DetectionService.DetectionBusy as e:
+        await msg.edit(content=f"❌ {e}")
+        return
     if price and selector:
         view = ConfirmPriceView()
         await msg.edit(content=f"Is this the correct price for **{name}**? `{price}`", view=view)
         timeout = await view.wait()
         if view.value is True:
-            js_required = True
-            try:
-                if Scraper.selector_works_without_js(url, selector, price):
-                    js_required = False
-            except Exception:
-                pass
-            # Buffer new selector if domain is not in selector_data
+            # Detection already checked the selector against the plain HTML
+            js_required = js_used
+            # Buffer new selector if domain is not in selector_data, structured data isn't a CSS selector
             domain = AutoDetectPrice.get_domain(url)
             selector_data = JsonHandler.get_selector_data()
-            if domain not in selector_data:
+            if domain not in selector_data and selector != StructuredData.STRUCTURED_SELECTOR:
                 JsonHandler.add_selector_to_buffer(domain, selector, js_required)
             new_tracker = {
                 "name": name,
@@ -423,16 +442,15 @@ async def addPrivateTracker(interaction: discord.Interaction, name: str, url: st
     user_id = str(interaction.user.id)
     await interaction.response.send_message("Checking JavaScript requirements. One moment...")
     msg = await interaction.original_response()
-    if isValidUrl(url):
+    if await asyncio.to_thread(isValidUrl, url):
         js_required = False
         found_price = None
         try:
-            html_text = requests.get(url, timeout=10).text
-            soup = BeautifulSoup(html_text, "lxml")
-            price_element = soup.select_one(css_selector)
-            if price_element:
-                found_price = price_element.get_text(strip=True)
-            js_required = price_element is None
+            found_price = await DetectionService.select_plain_text(interaction.user.id, url, css_selector)
+            js_required = found_price is None
+        except DetectionService.DetectionBusy as e:
+            await msg.edit(content=f"❌ {e}")
+            return
         except requests.exceptions.Timeout:
             lh.log(f"Timeout checking JS requirement for {url}", "error")
             js_required = True
@@ -474,13 +492,9 @@ async def removeTracker(interaction: discord.Interaction, id: int):
     lh.log("Getting user id", "log")
     user_id = str(interaction.user.id)
     lh.log_done()
-    lh.log("Loading user and global trackers from data.json", "log")
-    with open(JsonHandler.get_active_json_path(), "r") as file:
-        data = json.load(file)
-    lh.log_done()
     if guild_id is None:
         lh.log("Not in a guild only checking user's own trackers", "log")
-        user_trackers = data.get('users', {}).get(user_id, [])
+        user_trackers = JsonHandler.getUserTrackers(user_id)
         if any(t['id'] == id for t in user_trackers):
             result = JsonHandler.removeUserTracker(user_id, id)
             if result:
@@ -493,13 +507,10 @@ async def removeTracker(interaction: discord.Interaction, id: int):
             lh.log(f"Invalid tracker id {id} for user {user_id} (DM context)", "warn")
             await interaction.followup.send("❌ Invalid tracker id.", suppress_embeds=True)
         return
-    global_trackers = data.get('global', {}).get(guild_id, [])
-    is_global = any(t['id'] == id for t in global_trackers)
-    owner = None
-    for uid, trackers in data.get('users', {}).items():
-        if any(t['id'] == id for t in trackers):
-            owner = uid
-            break
+    lh.log("Looking up tracker in the tracker database", "log")
+    is_global = JsonHandler.getObject(id, guild_id) is not None
+    owner = JsonHandler.getUserTrackerOwner(id)
+    lh.log_done()
     if is_global and not interaction.user.guild_permissions.administrator:
         lh.log(f"User {user_id} tried to remove global tracker {id} without admin rights", "warn")
         await interaction.followup.send("❌ Only administrators can remove global trackers.", suppress_embeds=True)
@@ -575,4 +586,50 @@ async def set_scan_interval(interaction: discord.Interaction, interval: int):
     set_guild_setting(guild_id, "scan_interval", interval)
     await interaction.response.send_message(f"✅ Scan interval set to {interval} hours.")
 
+@client.tree.command(name="setscanbounds", description="(Admin only)")
+async def set_scan_bounds(interaction: discord.Interaction, min_hours: float, max_hours: float):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ Only administrators can set the scan bounds.")
+        return
+    if min_hours <= 0 or max_hours < min_hours:
+        await interaction.response.send_message("❌ Minimum must be above 0 and not larger than the maximum.")
+        return
+    guild_id = str(interaction.guild.id)
+    set_guild_setting(guild_id, "min_scan_interval", min_hours)
+    set_guild_setting(guild_id, "max_scan_interval", max_hours)
+    intervals = JsonHandler.get_scan_intervals(JsonHandler.schedule_key("", guild_id=guild_id))
+    summary = ""
+    if intervals:
+        average = sum(intervals) / len(intervals) / 3600
+        summary = f" {len(intervals)} trackers are currently scanned every {average:.1f} hours on average."
+    await interaction.response.send_message(
+        f"✅ Trackers are now scanned between every {min_hours} and {max_hours} hours depending on how often their price changes.{summary}"
+    )
+
+@client.tree.command(name="breakers", description="(Admin only) Show shops that are skipped because they keep failing")
+async def show_breakers(interaction: discord.Interaction, reset_domain: str = None):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ Only administrators can view the circuit breakers.")
+        return
+    if reset_domain:
+        if CircuitBreaker.reset(reset_domain):
+            lh.log(f"{get_user_display(interaction.user)} reset the circuit breaker for {reset_domain}", "log")
+            await interaction.response.send_message(f"✅ {reset_domain} will be scanned again on its next due scan.")
+        else:
+            await interaction.response.send_message(f"❌ {reset_domain} has no recorded failures.")
+        return
+    states = CircuitBreaker.get_states()
+    if not states:
+        await interaction.response.send_message("✅ All shops are answering normally.")
+        return
+    lines = []
+    for state in states:
+        line = f"{state['domain']}: {state['state']}, {state['failures']} failed pages"
+        if state['state'] == CircuitBreaker.OPEN:
+            line += f", next probe in {state['retry_in'] / 60:.0f} min"
+        if state['last_failure']:
+            line += f" | last: {state['last_failure'][:100]}"
+        lines.append(line)
+    await interaction.response.send_message("Circuit breakers:\n" + "\n".join(lines)[:1900], suppress_embeds=True)
+
 client.run(discordBotKey)
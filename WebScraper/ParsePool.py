@@ -0,0 +1,90 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import LogHandler as lh
+
+# Worker processes for CPU bound HTML parsing, 0 parses in threads instead
+PARSE_WORKERS = os.cpu_count() or 1
+# Smaller documents parse faster than they are copied to a worker
+MIN_PROCESS_CHARS = 20_000
+
+_executor = None
+_lock = threading.Lock()
+
+
+def start():
+    """Fork the parse workers, call this once at startup before any thread is started.
+
+    Forking while other threads run can copy a lock they hold into the child, which
+    then deadlocks, so workers are never forked later on. Workers are forked so they
+    start with the bot's modules already imported, spawned workers would re-run
+    Main.py. Without fork (Windows) parsing stays in threads.
+    """
+    global _executor
+    if PARSE_WORKERS <= 0 or "fork" not in multiprocessing.get_all_start_methods():
+        return
+    with _lock:
+        if _executor is not None:
+            return
+        _executor = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("fork"))
+        # A fork pool starts all its workers on the first submit
+        _executor.submit(os.getpid).result()
+    lh.log(f"Started {PARSE_WORKERS} parse worker processes", "log")
+
+
+def _drop(executor):
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _executor_for(html_text):
+    if not html_text or len(html_text) < MIN_PROCESS_CHARS:
+        return None
+    return _executor
+
+
+def run_sync(func, html_text, *args):
+    """Call func(html_text, *args) in a worker process and return its result.
+
+    func and its result must be picklable, e.g. a module level function returning texts.
+    """
+    executor = _executor_for(html_text)
+    if executor is None:
+        return func(html_text, *args)
+    try:
+        return executor.submit(func, html_text, *args).result()
+    except BrokenProcessPool:
+        lh.log("A parse worker died, parsing in threads until the next restart", "warn")
+        _drop(executor)
+        return func(html_text, *args)
+
+
+async def run(func, html_text, *args):
+    """run_sync for the event loop, the loop never waits on a parse."""
+    executor = _executor_for(html_text)
+    if executor is None:
+        return await asyncio.to_thread(func, html_text, *args)
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, html_text, *args)
+    except BrokenProcessPool:
+        lh.log("A parse worker died, parsing in threads until the next restart", "warn")
+        _drop(executor)
+        return await asyncio.to_thread(func, html_text, *args)
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown)
@@ -3,69 +3,157 @@ import Scraper
 import json
 import LogHandler as lh
 import asyncio
+import time
+import uuid
+import DriverPool
+import RenderWorker
+import HttpClient
+import ScanPlanner
+import DomainScheduler
+import CircuitBreaker
+import ScrapeResult
+import JobQueue
 
 # Define semaphores for concurrency limits
 SELENIUM_LIMIT = 2
-HTML_LIMIT = 4
-selenium_semaphore = asyncio.Semaphore(SELENIUM_LIMIT)
+# JS pages share the browsers as tabs, so more of them can be in flight than there are browsers
+JS_PAGE_LIMIT = SELENIUM_LIMIT * RenderWorker.TABS_PER_BROWSER
+# Non-JS scrapes run on the event loop, HttpClient limits connections per host
+HTML_LIMIT = 100
+selenium_semaphore = asyncio.Semaphore(JS_PAGE_LIMIT)
 html_semaphore = asyncio.Semaphore(HTML_LIMIT)
+# One warm browser per Selenium slot
+DriverPool.set_pool_size(SELENIUM_LIMIT)
+# Hand pages to ScanWorker processes through JobQueue instead of scraping them here,
+# Main turns this on when DISTRIBUTED_SCANS=1 is set in .env
+DISTRIBUTED = False
+# How long a scan waits for the workers before failing the pages they didn't finish
+DISTRIBUTED_TIMEOUT = 15 * 60
+DISTRIBUTED_POLL_INTERVAL = 2
 
-async def retry_async(coro_func, *args, retries=2, delay=2, **kwargs):
-    for attempt in range(retries):
-        result = await coro_func(*args, **kwargs)
-        if result is not None:
-            return result
-        if attempt < retries - 1:
+async def limited_scrape_page(page, DEBUG, discord_notify, batch=None):
+    # Wait for the shop's own budget first so a global slot is never held while a domain is rate limited
+    async with DomainScheduler.slot(page['url']):
+        if page['js']:
+            async with selenium_semaphore:
+                return await Scraper.extractPagePrices(page, DEBUG, discord_notify=discord_notify, batch=batch)
+        else:
+            async with html_semaphore:
+                return await Scraper.extractPagePrices(page, DEBUG, discord_notify=discord_notify, batch=batch)
+
+async def scrape_page(page, DEBUG, discord_notify, batch=None):
+    """Scrape a page and retry its failed trackers as their failure class allows.
+
+    Only fetch failures are retried, with exponential backoff, a selector miss on a
+    page that was fetched fine would fail the same way again. The domain's circuit
+    breaker sees the page once, with its final results.
+    """
+    if not CircuitBreaker.allow(page['url']):
+        lh.log(f"Skipping {page['url']}: circuit breaker for its domain is open", "log")
+        return [ScrapeResult.failure(ScrapeResult.CIRCUIT_OPEN)] * len(page['entries'])
+    results = {}
+    final = None
+    reached = False
+    try:
+        attempt = 0
+        attempt_pages = [page]
+        notify = discord_notify
+        while True:
+            for attempt_page in attempt_pages:
+                try:
+                    attempt_results = await limited_scrape_page(attempt_page, DEBUG, notify, batch)
+                    reached = True
+                except DomainScheduler.DomainThrottled as e:
+                    lh.log(f"Skipping {attempt_page['url']}: {e}", "warn")
+                    attempt_results = [ScrapeResult.failure(ScrapeResult.BLOCKED, str(e))] * len(attempt_page['entries'])
+                for entry, result in zip(attempt_page['entries'], attempt_results):
+                    results[id(entry)] = result
+            failed = [entry for entry in page['entries'] if ScrapeResult.should_retry(results[id(entry)], attempt)]
+            # Other pages may have opened the breaker in the meantime
+            if not failed or CircuitBreaker.is_open(page['url']):
+                break
+            status = results[id(failed[0])].status
+            delay = ScrapeResult.backoff_delay(status, attempt)
+            lh.log(f"Retrying {len(failed)} tracker(s) on {page['url']} in {delay:.1f}s after a {status} failure", "log")
             await asyncio.sleep(delay)
-    return None
+            attempt += 1
+            attempt_pages = ScanPlanner.build_scan_plan(failed)
+            notify = None
+        final = [results[id(entry)] for entry in page['entries']]
+        return final
+    finally:
+        # Pages skipped for a Retry-After pause never reached the site
+        CircuitBreaker.record(page, final if reached else None)
 
-async def limited_extract_price(tracker, DEBUG, guild_id, user_id, discord_notify):
-    js_needed = tracker.get('js', False)
-    if js_needed:
-        async with selenium_semaphore:
-            return await Scraper.extractPrice(tracker, DEBUG, guild_id=guild_id, user_id=user_id, discord_notify=discord_notify)
-    else:
-        async with html_semaphore:
-            return await Scraper.extractPrice(tracker, DEBUG, guild_id=guild_id, user_id=user_id, discord_notify=discord_notify)
+async def scan_entries(entries, DEBUG, discord_notify=None, batch=None):
+    """Fetch every distinct page once and return a ScrapeResult per entry."""
+    pages = ScanPlanner.interleave_by_domain(ScanPlanner.build_scan_plan(entries))
+    lh.log(f"Scan plan: {len(entries)} trackers on {len(pages)} unique pages", "log")
+    page_results = await asyncio.gather(*[scrape_page(page, DEBUG, discord_notify, batch) for page in pages])
+    results = {}
+    for page, page_result in zip(pages, page_results):
+        for entry, result in zip(page['entries'], page_result):
+            results[id(entry)] = result
+    log_failures(results.values())
+    return [results[id(entry)] for entry in entries]
 
-async def CheckPrivateTrackers(DEBUG, discord_notify=None):
-    """Check all private trackers for price changes and return a list of changes."""
+def log_failures(results):
+    failures = {}
+    for result in results:
+        if not result.ok:
+            failures[result.status] = failures.get(result.status, 0) + 1
+    if failures:
+        lh.log("Failed scrapes: " + ", ".join(f"{count} {status}" for status, count in sorted(failures.items())), "warn")
+
+async def scan_entries_distributed(entries, batch, discord_notify=None):
+    """Queue one job per domain for ScanWorker processes and return a ScrapeResult per entry.
+
+    A domain's pages stay on one worker so its rate limits still hold. Workers send
+    back the results and the prices, selectors and JS flags to store, the writes and the
+    selector DMs happen here.
+    """
+    groups = ScanPlanner.group_by_domain(ScanPlanner.build_scan_plan(entries))
+    batch_id = uuid.uuid4().hex
+    job_ids = await asyncio.to_thread(JobQueue.enqueue, batch_id, [{"pages": pages} for pages in groups])
+    lh.log(f"Queued {len(entries)} trackers on {len(job_ids)} domains for scan workers", "log")
+    deadline = time.monotonic() + DISTRIBUTED_TIMEOUT
+    try:
+        while True:
+            finished = await asyncio.to_thread(JobQueue.get_results, batch_id)
+            if len(finished) == len(job_ids) or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(DISTRIBUTED_POLL_INTERVAL)
+    finally:
+        await asyncio.to_thread(JobQueue.forget, batch_id)
+    results = {}
+    for job_id, pages in zip(job_ids, groups):
+        job_result = finished.get(job_id)
+        if job_result is None:
+            lh.log(f"No scan worker finished {pages[0]['url']} and {len(pages) - 1} other page(s) on its domain", "warn")
+            for page in pages:
+                for entry in page['entries']:
+                    results[id(entry)] = ScrapeResult.failure(ScrapeResult.TRANSIENT, "no scan worker finished the page")
+            continue
+        for write in job_result['writes']:
+            if write['type'] == "js":
+                await asyncio.to_thread(batch.set_trackers_js, write['uuids'], write['value'])
+                continue
+            add = batch.add_price if write['type'] == "price" else batch.add_selector
+            await asyncio.to_thread(add, write['uuid'], write['value'])
+        for page, page_results in zip(pages, job_result['results']):
+            for entry, data in zip(page['entries'], page_results):
+                result = ScrapeResult.ScrapeResult.from_dict(data)
+                results[id(entry)] = result
+                if result.status == ScrapeResult.SELECTOR_MISS and discord_notify:
+                    asyncio.create_task(discord_notify(entry['tracker'], entry['user_id']))
+    log_failures(results.values())
+    return [results[id(entry)] for entry in entries]
+
+def compare_private_prices(entries, scraped_prices):
     changed_prices = []
-    user_ids = JsonHandler.get_all_user_ids()
-    tasks = []
-    tracker_refs = []
-    for user_id in user_ids:
-        user_trackers = JsonHandler.getUserTrackers(user_id)
-        seen = set()
-        unique_trackers = []
-        for tracker in user_trackers:
-            key = (tracker['url'], tracker['selector'])
-            if key not in seen:
-                seen.add(key)
-                unique_trackers.append(tracker)
-        for tracker in unique_trackers:
-            tasks.append(
-                limited_extract_price(tracker, DEBUG, guild_id=None, user_id=user_id, discord_notify=discord_notify)
-            )
-            tracker_refs.append((tracker, user_id))
-    scraped_prices = await asyncio.gather(*tasks)
-    # Retry failed (None) scrapes
-    retry_tasks = []
-    retry_refs = []
-    for (ref, result) in zip(tracker_refs, scraped_prices):
-        if result is None:
-            tracker, user_id = ref
-            retry_tasks.append(retry_async(
-                limited_extract_price, tracker, DEBUG, guild_id=None, user_id=user_id, discord_notify=discord_notify
-            ))
-            retry_refs.append(ref)
-    if retry_tasks:
-        retry_results = await asyncio.gather(*retry_tasks)
-        for idx, (ref, retry_result) in enumerate(zip(retry_refs, retry_results)):
-            i = tracker_refs.index(ref)
-            scraped_prices[i] = retry_result
-    # Compare scraped prices to stored prices
-    for (old, user_id), new_price in zip(tracker_refs, scraped_prices):
+    for entry, new_price in zip(entries, scraped_prices):
+        old = entry['tracker']
+        user_id = entry['user_id']
         price_old = old['currentPrice'].replace("€", "")
         lh.log(f"Tracker ID: {old['id']} | Old price: {price_old} | Scraped price: {new_price}", "log")
         if price_old != new_price:
@@ -79,35 +167,10 @@ async def CheckPrivateTrackers(DEBUG, discord_notify=None):
             })
     return changed_prices if changed_prices else None
 
-async def CheckGlobalTrackers(DEBUG, guild_id, discord_notify=None):
-    """Check all global trackers for price changes and return a list of changes."""
+def compare_global_prices(entries, scraped_prices):
     changed_prices = []
-    guild_id = str(guild_id)
-    json_objects = JsonHandler.getAllJsonData(guild_id)
-    tasks = []
-    tracker_refs = []
-    for tracker in json_objects:
-        tasks.append(
-            limited_extract_price(tracker, DEBUG, guild_id=guild_id, user_id=None, discord_notify=discord_notify)
-        )
-        tracker_refs.append(tracker)
-    scraped_prices = await asyncio.gather(*tasks)
-    # Retry failed (None) scrapes
-    retry_tasks = []
-    retry_refs = []
-    for (ref, result) in zip(tracker_refs, scraped_prices):
-        if result is None:
-            retry_tasks.append(retry_async(
-                limited_extract_price, ref, DEBUG, guild_id=guild_id, user_id=None, discord_notify=discord_notify
-            ))
-            retry_refs.append(ref)
-    if retry_tasks:
-        retry_results = await asyncio.gather(*retry_tasks)
-        for idx, (ref, retry_result) in enumerate(zip(retry_refs, retry_results)):
-            i = tracker_refs.index(ref)
-            scraped_prices[i] = retry_result
-    # Compare scraped prices to stored prices
-    for old, new_price in zip(tracker_refs, scraped_prices):
+    for entry, new_price in zip(entries, scraped_prices):
+        old = entry['tracker']
         price_old = old['currentPrice'].replace("€", "")
         lh.log(f"Tracker ID: {old['id']} | Old price: {price_old} | Scraped price: {new_price}", "log")
         if new_price is not None and price_old != new_price:
@@ -124,3 +187,86 @@ async def CheckGlobalTrackers(DEBUG, guild_id, discord_notify=None):
                 "New price": None
             })
     return changed_prices if changed_prices else None
+
+async def ScanEntries(entries, DEBUG, discord_notify=None):
+    """Scrape plan entries in one deduplicated pass and return a ScrapeResult per entry."""
+    # All results of this pass are written in one transaction at the end
+    batch = JsonHandler.ScanBatch()
+    try:
+        if DISTRIBUTED:
+            return await scan_entries_distributed(entries, batch, discord_notify=discord_notify)
+        return await scan_entries(entries, DEBUG, discord_notify=discord_notify, batch=batch)
+    finally:
+        await asyncio.to_thread(batch.commit)
+
+def compare_entries(entries, results):
+    """Compare ScrapeResults with the stored prices.
+
+    Trackers skipped by an open circuit breaker are left out, so a site that is
+    down doesn't report every tracker as failed on each scan.
+    Returns (private changes or None, {guild_id: global changes or None}).
+    """
+    private_entries = []
+    private_prices = []
+    guild_entries = {}
+    for entry, result in zip(entries, results):
+        if result.status == ScrapeResult.CIRCUIT_OPEN:
+            continue
+        price = result.price
+        if entry['guild_id'] is not None:
+            guild_entry_list, prices = guild_entries.setdefault(entry['guild_id'], ([], []))
+            guild_entry_list.append(entry)
+            prices.append(price)
+        else:
+            private_entries.append(entry)
+            private_prices.append(price)
+    changed_private = compare_private_prices(private_entries, private_prices)
+    changed_global = {
+        guild_id: compare_global_prices(guild_entry_list, prices)
+        for guild_id, (guild_entry_list, prices) in guild_entries.items()
+    }
+    return changed_private, changed_global
+
+async def CheckEntries(entries, DEBUG, discord_notify=None):
+    """Scan plan entries and compare them with their stored prices.
+
+    Returns (private changes or None, {guild_id: global changes or None}).
+    """
+    results = await ScanEntries(entries, DEBUG, discord_notify=discord_notify)
+    HttpClient.log_pool_stats()
+    RenderWorker.log_render_stats()
+    return compare_entries(entries, results)
+
+def collect_all_entries(guild_ids=None, include_private=True):
+    """Plan entries for every private tracker and the global trackers of guild_ids."""
+    private_trackers = {}
+    if include_private:
+        for user_id in JsonHandler.get_all_user_ids():
+            private_trackers[user_id] = JsonHandler.getUserTrackers(user_id)
+    global_trackers = {}
+    for guild_id in guild_ids or []:
+        guild_id = str(guild_id)
+        global_trackers[guild_id] = JsonHandler.getAllJsonData(guild_id)
+    return ScanPlanner.collect_entries(private_trackers, global_trackers)
+
+async def CheckAllTrackers(DEBUG, guild_ids=None, include_private=True, discord_notify=None):
+    """Scan private trackers and the global trackers of guild_ids in one deduplicated pass.
+
+    Returns (private changes or None, {guild_id: global changes or None}).
+    """
+    entries = collect_all_entries(guild_ids, include_private)
+    changed_private, changed_global = await CheckEntries(entries, DEBUG, discord_notify=discord_notify)
+    for guild_id in guild_ids or []:
+        changed_global.setdefault(str(guild_id), None)
+    return changed_private, changed_global
+
+async def CheckPrivateTrackers(DEBUG, discord_notify=None):
+    """Check all private trackers for price changes and return a list of changes."""
+    changed_private, _ = await CheckAllTrackers(DEBUG, guild_ids=[], include_private=True, discord_notify=discord_notify)
+    return changed_private
+
+async def CheckGlobalTrackers(DEBUG, guild_id, discord_notify=None):
+    """Check all global trackers for price changes and return a list of changes."""
+    guild_id = str(guild_id)
+    _, changed_global = await CheckAllTrackers(DEBUG, guild_ids=[guild_id], include_private=False, discord_notify=discord_notify)
+    return changed_global.get(guild_id)
@@ -0,0 +1,223 @@
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from selenium.common.exceptions import WebDriverException
+import DriverPool
+import LogHandler as lh
+import AutoDetectPrice
+
+# Pages rendered side by side in one browser, each in its own tab
+TABS_PER_BROWSER = 4
+# JS renders poll for a selector with a digit in its text until this timeout
+RENDER_TIMEOUT = 10
+RENDER_POLL_INTERVAL = 0.25
+# Give up early when the loaded DOM hasn't changed for this long and no selector matched
+DOM_STABLE_SECONDS = 1.5
+# How long a caller waits for its page, including the time queued for a tab
+RENDER_WAIT_TIMEOUT = DriverPool.BORROW_TIMEOUT + 60
+# Texts of each selector's first match, the ready state, a cheap fingerprint of the DOM and the URL
+READINESS_SCRIPT = """
+const texts = arguments[0].map(selector => {
+    try {
+        const element = document.querySelector(selector);
+        return element ? element.textContent : null;
+    } catch (e) {
+        return null;
+    }
+});
+const body = document.body;
+return [texts, document.readyState, document.getElementsByTagName('*').length + ':' + (body ? body.textContent.length : 0), location.href];
+"""
+DIGIT_RE = re.compile(r"\d")
+
+
+class ReadinessCheck:
+    """Decides when a loading page shows a price, polled once per round.
+
+    poll() returns None while waiting, "price" once a selector has a digit in its
+    text, "stable" when the loaded page stopped changing without any selector
+    matching, or "timeout".
+    """
+
+    def __init__(self, selectors, timeout=RENDER_TIMEOUT):
+        self.selectors = selectors
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout
+        self.fingerprint = None
+        self.stable_since = self.started
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def poll(self, driver):
+        now = time.monotonic()
+        try:
+            texts, ready_state, fingerprint, location = driver.execute_script(READINESS_SCRIPT, self.selectors)
+        except WebDriverException:
+            # The document can be replaced mid-poll, e.g. by a redirect
+            texts, ready_state, fingerprint, location = [], None, None, None
+        if location == "about:blank":
+            # The tab hasn't started loading its URL yet
+            texts, ready_state = [], None
+        if any(text and DIGIT_RE.search(text) for text in texts):
+            return "price"
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.stable_since = now
+        elif ready_state == "complete" and all(text is None for text in texts) and now - self.stable_since >= DOM_STABLE_SECONDS:
+            return "stable"
+        if now >= self.deadline:
+            return "timeout"
+        return None
+
+
+_render_stats = {}
+_render_stats_lock = threading.Lock()
+
+
+def record_render(url, outcome, elapsed):
+    domain = AutoDetectPrice.get_domain(url)
+    with _render_stats_lock:
+        entry = _render_stats.setdefault(domain, {"renders": 0, "price": 0, "stable": 0, "timeout": 0, "price_seconds": 0.0})
+        entry["renders"] += 1
+        entry[outcome] += 1
+        if outcome == "price":
+            entry["price_seconds"] += elapsed
+
+
+def get_render_stats():
+    """Per domain JS render counts by outcome and the average time to price in seconds."""
+    with _render_stats_lock:
+        stats = {domain: dict(entry) for domain, entry in _render_stats.items()}
+    for entry in stats.values():
+        entry["time_to_price"] = entry["price_seconds"] / entry["price"] if entry["price"] else None
+    return stats
+
+
+def log_render_stats():
+    for domain, entry in sorted(get_render_stats().items()):
+        time_to_price = f"{entry['time_to_price']:.1f}s" if entry["time_to_price"] is not None else "n/a"
+        lh.log(f"JS renders {domain}: {entry['renders']} renders, time to price {time_to_price}, "
+               f"{entry['stable']} gave up early, {entry['timeout']} timed out", "log")
+
+
+class RenderJob:
+    def __init__(self, url, selectors, lean):
+        self.url = url
+        self.selectors = selectors
+        self.lean = lean
+        self.future = Future()
+        self.check = None
+
+
+_jobs = deque()
+_jobs_cond = threading.Condition()
+_workers = []
+
+
+def _take_job(lean=None, block=True):
+    """Next queued job, of the given browser profile if lean isn't None."""
+    with _jobs_cond:
+        while True:
+            for job in list(_jobs):
+                if lean is not None and job.lean != lean:
+                    continue
+                _jobs.remove(job)
+                # Skips jobs whose caller gave up waiting
+                if job.future.set_running_or_notify_cancel():
+                    return job
+            if not block:
+                return None
+            _jobs_cond.wait()
+
+
+def _start(driver, handle, job):
+    driver.switch_to.window(handle)
+    # Blank the tab first so polling never reads the previous page's price
+    driver.get("about:blank")
+    # Assigning the location returns at once, unlike driver.get
+    driver.execute_script("window.location.href = arguments[0];", job.url)
+    job.check = ReadinessCheck(job.selectors)
+
+
+def _render_tabs(pooled, job):
+    """Render job and queued jobs of the same profile in the tabs of one browser.
+
+    Finished tabs are reused for the next queued job until the queue is empty or
+    the browser has rendered enough pages to be recycled.
+    """
+    driver = pooled.driver
+    lean = job.lean
+    idle_tabs = list(driver.window_handles)
+    active = {}
+    first = True
+    try:
+        while job is not None or active:
+            while job is not None:
+                if not idle_tabs:
+                    driver.switch_to.new_window("tab")
+                    idle_tabs.append(driver.current_window_handle)
+                handle = idle_tabs.pop()
+                _start(driver, handle, job)
+                active[handle] = job
+                if not first:
+                    pooled.pages += 1
+                first = False
+                job = None
+                if len(active) < TABS_PER_BROWSER and pooled.pages < DriverPool.MAX_PAGES_PER_DRIVER:
+                    job = _take_job(lean, block=False)
+            for handle, tab_job in list(active.items()):
+                driver.switch_to.window(handle)
+                outcome = tab_job.check.poll(driver)
+                if outcome is None:
+                    continue
+                record_render(tab_job.url, outcome, tab_job.check.elapsed())
+                tab_job.future.set_result(driver.page_source)
+                del active[handle]
+                idle_tabs.append(handle)
+            if len(active) < TABS_PER_BROWSER and pooled.pages < DriverPool.MAX_PAGES_PER_DRIVER:
+                job = _take_job(lean, block=False)
+            if active and job is None:
+                time.sleep(RENDER_POLL_INTERVAL)
+    except Exception as e:
+        for tab_job in active.values():
+            tab_job.future.set_exception(e)
+        if job is not None and not job.future.done():
+            job.future.set_exception(e)
+        raise
+
+
+def _worker():
+    while True:
+        job = _take_job()
+        try:
+            with DriverPool.get_pool().borrow_pooled(job.lean) as pooled:
+                _render_tabs(pooled, job)
+        except Exception as e:
+            lh.log(f"Render worker lost its browser: {e}", "warn")
+            if not job.future.done():
+                job.future.set_exception(e)
+
+
+def _ensure_workers():
+    """One worker per browser the pool may hold."""
+    with _jobs_cond:
+        while len(_workers) < DriverPool.get_pool().size:
+            worker = threading.Thread(target=_worker, name=f"render-{len(_workers)}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def submit(url, selectors, lean=True):
+    """Queue url for rendering in a browser tab and return a concurrent.futures.Future of its page source.
+
+    The page is returned once a selector shows a price, or when it settled if selectors is empty.
+    """
+    _ensure_workers()
+    job = RenderJob(url, selectors, lean)
+    with _jobs_cond:
+        _jobs.append(job)
+        _jobs_cond.notify()
+    return job.future
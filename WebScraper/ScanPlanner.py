@@ -0,0 +1,81 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that only identify the referrer and never change the page content
+TRACKING_PARAM_PREFIXES = ("utm_",)
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_", "_ga"}
+
+
+def canonicalize_url(url):
+    """Normalize a tracker URL so the same product page maps to one key."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ]
+    query.sort()
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def make_entry(tracker, guild_id=None, user_id=None):
+    """A single tracker owned by a guild (global tracker) or a user (private tracker)."""
+    return {"tracker": tracker, "guild_id": guild_id, "user_id": user_id}
+
+
+def build_scan_plan(entries):
+    """Group tracker entries by canonical URL so every page is fetched once per cycle.
+
+    Returns a list of pages, each with the URL to fetch, whether JS rendering is
+    needed (if any tracker on the page needs it), the distinct selectors to
+    evaluate and the entries to fan the results back out to.
+    """
+    pages = {}
+    for entry in entries:
+        tracker = entry["tracker"]
+        key = canonicalize_url(tracker['url'])
+        page = pages.get(key)
+        if page is None:
+            page = {"key": key, "url": tracker['url'], "js": False, "selectors": [], "entries": []}
+            pages[key] = page
+        page["js"] = page["js"] or tracker.get('js', False)
+        if tracker['selector'] not in page["selectors"]:
+            page["selectors"].append(tracker['selector'])
+        page["entries"].append(entry)
+    return list(pages.values())
+
+
+def group_by_domain(pages):
+    """Split pages into one list per domain, in order of first appearance."""
+    by_domain = {}
+    for page in pages:
+        domain = (urlsplit(page["url"]).hostname or "").lower()
+        if domain.startswith("www."):
+            domain = domain[4:]
+        by_domain.setdefault(domain, []).append(page)
+    return list(by_domain.values())
+
+
+def interleave_by_domain(pages):
+    """Order pages round-robin over their domains so no shop gets all early request slots."""
+    queues = group_by_domain(pages)
+    ordered = []
+    for index in range(max((len(queue) for queue in queues), default=0)):
+        ordered.extend(queue[index] for queue in queues if index < len(queue))
+    return ordered
+
+
+def collect_entries(private_trackers=None, global_trackers=None):
+    """Flatten {user_id: [trackers]} and {guild_id: [trackers]} into plan entries."""
+    entries = []
+    for user_id, trackers in (private_trackers or {}).items():
+        for tracker in trackers:
+            entries.append(make_entry(tracker, user_id=user_id))
+    for guild_id, trackers in (global_trackers or {}).items():
+        for tracker in trackers:
+            entries.append(make_entry(tracker, guild_id=guild_id))
+    return entries
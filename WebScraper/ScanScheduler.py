@@ -0,0 +1,167 @@
+import asyncio
+import math
+import time
+import HttpClient
+import JsonHandler
+import LogHandler as lh
+import PriceTracker
+import RenderWorker
+import ScanPlanner
+
+# Longest sleep between checks of the queue, also how often new or removed trackers are picked up
+TICK_SECONDS = 30
+# Lower bound on scans started per tick, the real budget follows the number of trackers
+MIN_SCANS_PER_TICK = 10
+# Work through overdue scans (e.g. after a restart) at this multiple of the steady rate
+CATCH_UP_FACTOR = 2
+# Trackers on a page being fetched anyway are scanned along if they are due this soon
+COALESCE_WINDOW = 300
+PRIVATE_SCAN_INTERVAL = 3600
+PRIVATE_MIN_INTERVAL = 1800
+PRIVATE_MAX_INTERVAL = 24 * 3600
+# Guild defaults when min_scan_interval / max_scan_interval (hours) are not configured
+DEFAULT_MIN_INTERVAL_FACTOR = 0.5
+DEFAULT_MAX_INTERVAL_HOURS = 24
+# Unchanged prices are polled this much less often each scan, a change resets to the minimum
+BACKOFF_FACTOR = 1.5
+# Trackers that changed this recently are never polled slower than their base interval
+RECENT_CHANGE_WINDOW = 48 * 3600
+
+
+def entry_key(entry):
+    return JsonHandler.schedule_key(entry['tracker']['uuid'], entry['guild_id'], entry['user_id'])
+
+
+def entry_bounds(entry):
+    """(base, min, max) scan interval in seconds, from the guild's settings (hours) for global trackers."""
+    if entry['guild_id'] is None:
+        return PRIVATE_SCAN_INTERVAL, PRIVATE_MIN_INTERVAL, PRIVATE_MAX_INTERVAL
+    settings = JsonHandler.get_guild_config().get(entry['guild_id'], {})
+    base = max(60, float(settings.get("scan_interval", 1)) * 3600)
+    min_interval = settings.get("min_scan_interval")
+    min_interval = base * DEFAULT_MIN_INTERVAL_FACTOR if min_interval is None else float(min_interval) * 3600
+    max_interval = float(settings.get("max_scan_interval", DEFAULT_MAX_INTERVAL_HOURS)) * 3600
+    min_interval = max(60, min(min_interval, base))
+    return base, min_interval, max(max_interval, base)
+
+
+def next_interval(interval, changed, last_change, bounds, now):
+    """Adapt a tracker's interval after a scan, changed is None when the scrape failed."""
+    base, min_interval, max_interval = bounds
+    if changed:
+        interval = min_interval
+    elif changed is False:
+        interval *= BACKOFF_FACTOR
+    if last_change is not None and now - last_change < RECENT_CHANGE_WINDOW:
+        interval = min(interval, base)
+    return min(max_interval, max(min_interval, interval))
+
+
+def price_changed(entry, result):
+    if not result.ok:
+        return None
+    return entry['tracker']['currentPrice'].replace("€", "") != result.price
+
+
+def record_scans(keys, entries, results, bounds, scanned_at):
+    """Store each scan and schedule the tracker again after its adapted interval."""
+    rows = JsonHandler.get_scan_schedule(keys)
+    updates = []
+    for key, entry, result in zip(keys, entries, results):
+        row = rows.get(key)
+        if row is None:
+            continue
+        changed = price_changed(entry, result)
+        last_change = scanned_at if changed else row["last_change"]
+        interval = next_interval(row["interval"], changed, last_change, bounds[key], scanned_at)
+        updates.append((key, interval, scanned_at + interval, scanned_at, scanned_at if changed else None))
+    JsonHandler.update_scan_schedule(updates)
+
+
+def scans_per_tick(intervals):
+    """Scans per tick needed to keep up with every tracker's interval, with catch-up headroom."""
+    steady = sum(TICK_SECONDS / interval for interval in intervals.values())
+    return max(MIN_SCANS_PER_TICK, math.ceil(steady * CATCH_UP_FACTOR))
+
+
+def select_due_entries(entries_by_key, intervals, now, in_flight=()):
+    """Pick the earliest due trackers within this tick's budget plus same-page trackers due soon.
+
+    Trackers in in_flight are still being scanned and are skipped.
+    """
+    budget = scans_per_tick(intervals)
+    due = JsonHandler.get_due_scans(now, budget + len(in_flight))
+    keys = [key for key, _ in due if key in entries_by_key and key not in in_flight][:budget]
+    if not keys:
+        return []
+    pages = {ScanPlanner.canonicalize_url(entries_by_key[key]['tracker']['url']) for key in keys}
+    selected = set(keys)
+    for key, _ in JsonHandler.get_due_scans(now + COALESCE_WINDOW):
+        entry = entries_by_key.get(key)
+        if key not in selected and key not in in_flight and entry and ScanPlanner.canonicalize_url(entry['tracker']['url']) in pages:
+            keys.append(key)
+            selected.add(key)
+    return keys
+
+
+def group_by_page(keys, entries_by_key):
+    pages = {}
+    for key in keys:
+        pages.setdefault(ScanPlanner.canonicalize_url(entries_by_key[key]['tracker']['url']), []).append(key)
+    return list(pages.values())
+
+
+async def scan_page(keys, entries, bounds, in_flight, DEBUG, on_changes, discord_notify):
+    """Scan the due trackers of one page and schedule them again, keys leave in_flight when done."""
+    try:
+        scanned_at = time.time()
+        results = await PriceTracker.ScanEntries(entries, DEBUG, discord_notify=discord_notify)
+        await asyncio.to_thread(record_scans, keys, entries, results, bounds, scanned_at)
+        await on_changes(*PriceTracker.compare_entries(entries, results))
+    except Exception as e:
+        lh.log(f"Error scanning {entries[0]['tracker']['url']}: {e}", "error")
+    finally:
+        in_flight.difference_update(keys)
+
+
+async def run(DEBUG, get_guild_ids, on_changes, discord_notify=None):
+    """Scan trackers continuously as they come due instead of all at once every interval.
+
+    Every due page is scanned in its own task, so a slow or throttled shop never
+    holds up the pages after it. get_guild_ids() returns the guilds whose global
+    trackers are scanned and on_changes(changed_private, changed_global) is awaited
+    after every page.
+    """
+    in_flight = set()
+    tasks = set()
+    while True:
+        try:
+            entries = await asyncio.to_thread(PriceTracker.collect_all_entries, get_guild_ids(), True)
+            entries_by_key = {entry_key(entry): entry for entry in entries}
+            bounds = {key: entry_bounds(entry) for key, entry in entries_by_key.items()}
+            await asyncio.to_thread(JsonHandler.sync_scan_schedule, bounds)
+            now = time.time()
+            intervals = {key: base for key, (base, _, _) in bounds.items()}
+            keys = await asyncio.to_thread(select_due_entries, entries_by_key, intervals, now, set(in_flight))
+            if keys:
+                HttpClient.log_pool_stats()
+                RenderWorker.log_render_stats()
+                pages = group_by_page(keys, entries_by_key)
+                lh.log(f"Scanning {len(keys)} due tracker(s) on {len(pages)} page(s) of {len(entries_by_key)}, "
+                       f"{len(tasks)} page(s) still running", "log")
+                for page_keys in pages:
+                    in_flight.update(page_keys)
+                    page_entries = [entries_by_key[key] for key in page_keys]
+                    task = asyncio.create_task(
+                        scan_page(page_keys, page_entries, bounds, in_flight, DEBUG, on_changes, discord_notify)
+                    )
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            # Trackers being scanned are still due until their page finishes
+            upcoming = await asyncio.to_thread(JsonHandler.get_due_scans, time.time() + TICK_SECONDS, len(in_flight) + 1)
+            next_due = next((due for key, due in upcoming if key not in in_flight), None)
+        except Exception as e:
+            lh.log(f"Error in scan scheduler: {e}", "error")
+            next_due = None
+        delay = TICK_SECONDS if next_due is None else min(TICK_SECONDS, max(1, next_due - time.time()))
+        await asyncio.sleep(delay)
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import socket
+import threading
+from dotenv import load_dotenv
+import JobQueue
+import HttpClient
+import JsonHandler
+import LogHandler as lh
+import ParsePool
+import PriceTracker
+
+# Scrapes pages for a bot running with DISTRIBUTED_SCANS=1, start one per machine
+# with `python ScanWorker.py` and SCAN_QUEUE_PATH pointing at the bot's queue. Route stats
+# and cached pages go to SCAN_WORKER_DB_PATH, never to the bot's tracker database.
+DEBUG = False
+# Domain jobs worked on at once, their pages share the usual Selenium and domain limits
+JOBS_PER_WORKER = 4
+# Seconds between looks at an empty queue
+POLL_INTERVAL = 5
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+
+class RecordingBatch:
+    """Stands in for JsonHandler.ScanBatch, the coordinator stores the recorded writes."""
+
+    def __init__(self):
+        self.writes = []
+        self._lock = threading.Lock()
+
+    def _append(self, record):
+        with self._lock:
+            self.writes.append(record)
+
+    def add_price(self, tracker_uuid, new_price):
+        self._append({"type": "price", "uuid": tracker_uuid, "value": new_price})
+
+    def add_selector(self, tracker_uuid, selector):
+        self._append({"type": "selector", "uuid": tracker_uuid, "value": selector})
+
+    def set_trackers_js(self, tracker_uuids, js):
+        self._append({"type": "js", "uuids": list(tracker_uuids), "value": js})
+
+
+async def renew_lease(job_id):
+    while True:
+        await asyncio.sleep(JobQueue.LEASE_SECONDS / 3)
+        await asyncio.to_thread(JobQueue.renew, [job_id], WORKER_ID)
+
+
+async def run_job(job_id, payload):
+    """Scrape a job's pages and post the results, the lease is renewed while they run."""
+    pages = payload['pages']
+    lh.log(f"Scraping {len(pages)} page(s) starting with {pages[0]['url']}", "log")
+    batch = RecordingBatch()
+    renewer = asyncio.create_task(renew_lease(job_id))
+    try:
+        page_results = await asyncio.gather(*[PriceTracker.scrape_page(page, DEBUG, None, batch) for page in pages])
+    except Exception as e:
+        # The lease runs out and another worker retries the job
+        lh.log(f"Job {job_id} failed: {e}", "error")
+        return
+    finally:
+        renewer.cancel()
+    result = {
+        "results": [[result.to_dict() for result in results] for results in page_results],
+        "writes": batch.writes,
+    }
+    if not await asyncio.to_thread(JobQueue.complete, job_id, WORKER_ID, result):
+        lh.log(f"Lost the lease on job {job_id} before finishing it, dropping its results", "warn")
+
+
+async def main():
+    lh.log(f"Scan worker {WORKER_ID} taking jobs from {os.getenv('SCAN_QUEUE_PATH', JobQueue.QUEUE_PATH)}", "success")
+    running = set()
+    try:
+        while True:
+            if len(running) >= JOBS_PER_WORKER:
+                await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            try:
+                jobs = await asyncio.to_thread(JobQueue.lease, WORKER_ID, JOBS_PER_WORKER - len(running))
+            except Exception as e:
+                lh.log(f"Error reading the scan queue: {e}", "error")
+                jobs = []
+            for job_id, payload in jobs:
+                task = asyncio.create_task(run_job(job_id, payload))
+                running.add(task)
+                task.add_done_callback(running.discard)
+            if not jobs:
+                await asyncio.sleep(POLL_INTERVAL)
+    finally:
+        await HttpClient.close_async_session()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    JsonHandler.use_store(os.getenv("SCAN_WORKER_DB_PATH", JsonHandler.WORKER_DB_PATH))
+    ParsePool.start()
+    asyncio.run(main())
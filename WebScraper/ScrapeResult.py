@@ -0,0 +1,100 @@
+import asyncio
+import random
+import aiohttp
+import requests
+from selenium.common.exceptions import WebDriverException
+
+# Outcome classes of a scrape
+OK = "ok"
+TRANSIENT = "transient"
+BLOCKED = "blocked"
+SELECTOR_MISS = "selector-miss"
+PARSE_ERROR = "parse-error"
+# Skipped because the domain's circuit breaker is open
+CIRCUIT_OPEN = "circuit-open"
+
+# Per class: (retries, first delay in seconds, max delay), delays double per attempt.
+# A selector miss or unparsable price on a page we did fetch won't change on a re-fetch.
+RETRY_POLICIES = {
+    TRANSIENT: (3, 2, 30),
+    BLOCKED: (1, 30, 30),
+    SELECTOR_MISS: (0, 0, 0),
+    PARSE_ERROR: (0, 0, 0),
+    CIRCUIT_OPEN: (0, 0, 0),
+}
+# Random extra delay as a fraction of the backoff
+JITTER = 0.25
+
+
+class ScrapeResult:
+    """Price of one tracker, or why there is none."""
+
+    __slots__ = ("status", "price", "detail")
+
+    def __init__(self, status, price=None, detail=None):
+        self.status = status
+        self.price = price
+        self.detail = detail
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+    def __repr__(self):
+        return f"ScrapeResult({self.status!r}, price={self.price!r}, detail={self.detail!r})"
+
+    def to_dict(self):
+        return {"status": self.status, "price": self.price, "detail": self.detail}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["status"], data.get("price"), data.get("detail"))
+
+
+class ScrapeError(Exception):
+    """A fetch failure with a known class, e.g. an HTTP 403 (blocked) or 502 (transient)."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def success(price):
+    return ScrapeResult(OK, price)
+
+
+def failure(status, detail=None):
+    return ScrapeResult(status, detail=detail)
+
+
+def classify_exception(error):
+    """Map an exception raised while fetching a page to a result class."""
+    if isinstance(error, ScrapeError):
+        return error.status
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, aiohttp.ClientError,
+                          requests.RequestException, WebDriverException, ConnectionError)):
+        return TRANSIENT
+    return PARSE_ERROR
+
+
+def classify_status(status_code):
+    """Result class for a non-success HTTP status, None when the body is still worth parsing."""
+    if status_code in (401, 403, 429):
+        return BLOCKED
+    if status_code >= 500:
+        return TRANSIENT
+    return None
+
+
+def should_retry(result, attempt):
+    """True if a failed result may be retried after attempt retries already happened."""
+    if result.ok:
+        return False
+    return attempt < RETRY_POLICIES[result.status][0]
+
+
+def backoff_delay(status, attempt):
+    """Exponential backoff with jitter before retry number attempt + 1."""
+    _, first_delay, max_delay = RETRY_POLICIES[status]
+    delay = min(max_delay, first_delay * 2 ** attempt)
+    return delay + random.uniform(0, JITTER * delay)
@@ -1,19 +1,23 @@
-from bs4 import BeautifulSoup
-import requests
 import re
-from selenium import webdriver
-from selenium.webdriver.firefox.service import Service
-from selenium.webdriver.common.by import By
 import JsonHandler
 import LogHandler as lh
 import platform
-import json
 import os
 from urllib.parse import urlparse
 import asyncio
-from AutoDetectPrice import clean_price_text
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import AutoDetectPrice
+import DriverPool
+import RenderWorker
+import ParsePool
+import HttpClient
+import ScanPlanner
+import SelectorEngine
+import JsRouter
+import StructuredData
+import DomainScheduler
+import ScrapeResult
 
 def file_exists(path):
     if os.path.isfile(path):
@@ -21,172 +25,325 @@ def file_exists(path):
     else:
         return False
 
+# Parse plain HTML pages while they download and stop once every selector matched
+STREAMING_EXTRACTION = True
+STRUCTURED = StructuredData.STRUCTURED_SELECTOR
+# Responses that mean the shop wants us to back off
+THROTTLE_STATUSES = (429, 503)
+GECKODRIVER_PATH = DriverPool.GECKODRIVER_PATH
 if platform.system() == "Windows":
     lh.log("Using windows geckodriver path", "warn")
-    #GECKODRIVER_PATH = r"C:\\Coding\\Github\\WebScrapingDiscordBot\\WebScraper\\bin\\geckodriver\\geckodriver.exe"
-    GECKODRIVER_PATH = r"C:\Users\adami\Desktop\Personal-Github\WebScrapingDiscordBot\WebScraper\bin\geckodriver\geckodriver.exe"
-    lh.log("Using geckodriver path: " + GECKODRIVER_PATH, "log")
-    if file_exists(GECKODRIVER_PATH):
-        lh.log("geckodriver found", "success")
-    else:
-        lh.log("geckodriver not found, please install it", "error")
-        exit(1)
 else:
     lh.log("Using linux geckodriver path", "warn")
-    GECKODRIVER_PATH = "/usr/bin/geckodriver"
-    lh.log("Using geckodriver path: " + GECKODRIVER_PATH, "log")
-    if file_exists(GECKODRIVER_PATH):
-        lh.log("geckodriver found", "success")
-    else:
-        lh.log("geckodriver not found, please install it", "error")
-        exit(1)
-
-def get_site_html(url, selector, use_js):   
-    if use_js:
-        options = webdriver.FirefoxOptions()
-        options.add_argument('--headless')
-        service = Service(GECKODRIVER_PATH)
-        driver = webdriver.Firefox(service=service, options=options)
-        driver.get(url)
-        html = driver.page_source  # Always assign html
-        try:
-            # Wait until the element has non-empty text
-            WebDriverWait(driver, 10).until(
-                EC.text_to_be_present_in_element((By.CSS_SELECTOR, selector), "")
-            )
-            price_element = driver.find_element(By.CSS_SELECTOR, selector)
-            price_text = price_element.text
-            html = price_element.get_attribute('outerHTML')
-        except Exception:
-            pass  # html is already assigned
-        driver.quit()
-        return html
+lh.log("Using geckodriver path: " + GECKODRIVER_PATH, "log")
+if file_exists(GECKODRIVER_PATH):
+    lh.log("geckodriver found", "success")
+else:
+    lh.log("geckodriver not found, please install it", "error")
+    exit(1)
+
+async def get_site_html(url, selectors):
+    """Render a page once for all of its selectors, polled until any selector shows a price.
+
+    Renders are awaited without holding a thread, so a queue of JS pages never
+    starves the default executor the rest of the scan relies on.
+    """
+    if isinstance(selectors, str):
+        selectors = [selectors]
+    # Without CSS selectors the render waits for the page to settle
+    selectors = [s for s in selectors if SelectorEngine.is_css_selector(s)]
+    future = RenderWorker.submit(url, selectors, AutoDetectPrice.uses_lean_render(url))
+    # Cancelling the wrapper on timeout also drops the job if it is still queued
+    return await asyncio.wait_for(asyncio.wrap_future(future), RenderWorker.RENDER_WAIT_TIMEOUT)
+
+def select_prices_text(html_text, selectors):
+    """Parse HTML once and return {selector: stripped text of the first match, or None}."""
+    return SelectorEngine.select_texts(html_text, selectors)
+
+def check_response(url, resp):
+    """Abort the page on error statuses, pausing the domain when the shop answered with 429/503."""
+    if resp["status"] in THROTTLE_STATUSES:
+        DomainScheduler.report_throttled(url, resp.get("retry_after"))
+        raise DomainScheduler.DomainThrottled(f"{url} answered {resp['status']}")
+    status = ScrapeResult.classify_status(resp["status"])
+    if status is not None:
+        raise ScrapeResult.ScrapeError(status, f"{url} answered {resp['status']}")
+
+def hash_body(html_text):
+    return hashlib.sha256(html_text.encode("utf-8", errors="replace")).hexdigest()
+
+def cached_texts_for(cache, selectors):
+    """Return the cached selector results if every selector was evaluated before, else None."""
+    if not cache:
+        return None
+    texts = cache["selector_texts"]
+    if all(selector in texts for selector in selectors):
+        return {selector: texts[selector] for selector in selectors}
+    return None
+
+async def stream_selector_texts(url, selectors, cache, cached_texts, optional=()):
+    """Stream a plain HTTP page into the incremental parser and stop downloading at the last match.
+
+    Returns (texts, resp, body_hash), texts is None when the server answered 304.
+    The body hash is only known when the whole body was read, a body that matches
+    the last scan's reuses cached_texts instead of evaluating the selectors again.
+    """
+    # An lxml parser must only be used from one thread, each streamed page gets its own
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream")
+    loop = asyncio.get_running_loop()
+    state = {}
+    hasher = hashlib.sha256()
+
+    def feed(chunk, charset):
+        if "matcher" not in state:
+            state["matcher"] = SelectorEngine.StreamingMatcher(selectors, charset, optional)
+        return state["matcher"].feed(chunk)
+
+    def close():
+        return state.pop("matcher").close()
+
+    async def on_chunk(chunk, charset):
+        hasher.update(chunk)
+        return await loop.run_in_executor(executor, feed, chunk, charset)
+
+    try:
+        if cached_texts is not None:
+            resp = await HttpClient.stream_async(url, on_chunk, cache["etag"], cache["last_modified"])
+        else:
+            resp = await HttpClient.stream_async(url, on_chunk)
+        if resp["not_modified"]:
+            return None, resp, None
+        check_response(url, resp)
+        if "matcher" not in state:
+            return {selector: None for selector in selectors}, resp, None
+        if not resp["complete"]:
+            lh.log(f"Stopped reading {url} after {resp['bytes']} bytes, all selectors matched", "log")
+            return await loop.run_in_executor(executor, close), resp, None
+        lh.log(f"HTML response length for {url}: {resp['bytes']} bytes", "log")
+        body_hash = hasher.hexdigest()
+        if cached_texts is not None and cache["body_hash"] == body_hash:
+            lh.log(f"{url} content unchanged since last scan, reusing previous prices", "log")
+            return cached_texts, resp, body_hash
+        return await loop.run_in_executor(executor, close), resp, body_hash
+    finally:
+        # The matcher is also released on its own thread, even when the download failed
+        executor.submit(state.clear)
+        executor.shutdown(wait=False)
+
+async def fetch_selector_texts(url, selectors, use_js, cache_key=None, optional=()):
+    """Fetch a page and evaluate selectors on it, skipping the parse when the page is unchanged.
+
+    Plain HTTP fetches send the stored ETag / Last-Modified validators and a 304
+    reuses the previously extracted texts. A body whose hash matches the last scan
+    reuses the previous texts without evaluating the selectors. With
+    STREAMING_EXTRACTION the body is parsed while it downloads, so the hash is only
+    known when the download ran to the end. Optional selectors don't keep a streamed
+    download going once the others matched.
+    """
+    # Rendered and plain HTML of the same page differ, keep their caches apart
+    cache_key = (cache_key or url) + ("#js" if use_js else "")
+    cache = await asyncio.to_thread(JsonHandler.get_page_cache, cache_key)
+    cached_texts = cached_texts_for(cache, selectors)
+    etag = last_modified = None
+    if not use_js and STREAMING_EXTRACTION:
+        texts, resp, body_hash = await stream_selector_texts(url, selectors, cache, cached_texts, optional)
+        if texts is None:
+            lh.log(f"{url} not modified since last scan, reusing previous prices", "log")
+            return cached_texts
+        if resp["status"] == 200:
+            etag = resp["etag"]
+            last_modified = resp["last_modified"]
     else:
-        return requests.get(url).text
+        if use_js:
+            html_text = await get_site_html(url, selectors)
+        else:
+            resp = None
+            if cached_texts is not None:
+                resp = await HttpClient.fetch_async(url, cache["etag"], cache["last_modified"])
+                if resp["not_modified"]:
+                    lh.log(f"{url} not modified since last scan, reusing previous prices", "log")
+                    return cached_texts
+            if resp is None:
+                resp = await HttpClient.fetch_async(url)
+            check_response(url, resp)
+            html_text = resp["text"]
+            if resp["status"] == 200:
+                etag = resp["etag"]
+                last_modified = resp["last_modified"]
+        if not html_text or len(html_text) < 100:
+            lh.log(f"HTML response is empty or too short for {url} price likely rendered with JavaScript", "warn")
+        else:
+            lh.log(f"HTML response length for {url}: {len(html_text)}", "log")
+        body_hash = hash_body(html_text)
+        if cached_texts is not None and cache["body_hash"] == body_hash:
+            lh.log(f"{url} content unchanged since last scan, reusing previous prices", "log")
+            texts = cached_texts
+        else:
+            # Parsing is CPU bound, large pages go to a worker process
+            texts = await ParsePool.run(select_prices_text, html_text, selectors)
+    # Texts of other selectors stay valid as long as the body is the same
+    stored_texts = dict(cache["selector_texts"]) if cache and body_hash is not None and cache["body_hash"] == body_hash else {}
+    stored_texts.update(texts)
+    await asyncio.to_thread(JsonHandler.save_page_cache, cache_key, etag, last_modified, body_hash, stored_texts)
+    return texts
 
-async def extractPrice(object, DEBUG, guild_id=None, user_id=None, discord_notify=None, loop=None):
-    def blocking_scrape():
-        lh.log(f"Now scraping ID: {object['id']}", "log")
-        try:
-            url = object['url']
-            selector = object['selector']
-            use_js = object.get('js', False)
-            lh.log(f"Requesting URL: {url}", "log")
-            html_text = get_site_html(url, selector, use_js)
-            if not html_text or len(html_text) < 100:
-                lh.log(f"HTML response is empty or too short for {object['name']} price likely rendered with JavaScript", "warn")
-            else:
-                lh.log(f"HTML response length for {object['name']}: {len(html_text)}", "log")
-            soup = BeautifulSoup(html_text, "lxml")
-            lh.log(f"Using selector: {selector}", "log")
-            price_element = soup.select_one(selector)
-            
-            if not price_element:
-                
-                domain = urlparse(url).netloc.replace('www.', '')
-                selector_data = JsonHandler.get_selector_data()
-                entry = selector_data.get(domain, {})
-                selectors = entry.get("selectors", []) if isinstance(entry, dict) else entry
-                js_required = entry.get("js", use_js) if isinstance(entry, dict) else use_js
-
-                for alt_selector in selectors:
-                    
-                    if alt_selector == selector:
-                        continue
-                    
-                    html_text_alt = get_site_html(url, alt_selector, js_required)
-                    soup_alt = BeautifulSoup(html_text_alt, "lxml")
-                    price_element = soup_alt.select_one(alt_selector)
+def get_known_selectors(url, use_js):
+    """Return the alternative selectors stored for this domain and whether they need JS."""
+    domain = urlparse(url).netloc.replace('www.', '')
+    selector_data = JsonHandler.get_selector_data()
+    entry = selector_data.get(domain, {})
+    selectors = entry.get("selectors", []) if isinstance(entry, dict) else entry
+    js_required = entry.get("js", use_js) if isinstance(entry, dict) else use_js
+    return selectors, js_required
 
-                    if price_element:
-                        selector = alt_selector
-                        data_path = JsonHandler.get_active_json_path()
+def clean_scraped_price(object, price_text):
+    lh.log(f"Extracted price text for {object['name']}: '{price_text}'", "log")
+    match = re.search(r'\d+(?:[.,]\d{2})?', price_text)
+    if match:
+        clean_price = match.group(0)
+        lh.log(f"Cleaned price for {object['name']}: '{clean_price}'", "log")
+        return clean_price
+    lh.log(f"Could not extract price from text: '{price_text}'", "error")
+    return None
 
-                        with open(data_path, 'r') as f:
-                            data = json.load(f)
+async def extractPagePrices(page, DEBUG, discord_notify=None, loop=None, batch=None):
+    """Fetch one page, evaluate every selector on it and return a ScrapeResult per plan entry.
 
-                        updated = False
+    With a JsonHandler.ScanBatch results are buffered and committed by the caller,
+    otherwise they are written to the tracker database right away.
+    """
+    url = page['url']
+    use_js = page['js']
+    entries = page['entries']
+    lh.log(f"Now scraping {url} for {len(entries)} tracker(s)", "log")
+    try:
+        lh.log(f"Requesting URL: {url}", "log")
+        known_selectors, js_required = get_known_selectors(url, use_js)
+        # Known selectors for the domain are evaluated on the same document, as fallbacks
+        # they don't keep streaming going once the trackers' own selectors matched
+        all_selectors = list(page['selectors'])
+        optional = [s for s in known_selectors if s not in all_selectors]
+        all_selectors += optional
+        # Structured data (JSON-LD, product meta tags) is a fallback price for every tracker on the page
+        if STRUCTURED not in all_selectors:
+            all_selectors.append(STRUCTURED)
+            optional.append(STRUCTURED)
+        texts = None
+        probe_due = use_js and await asyncio.to_thread(JsRouter.should_probe_http, page)
+        if probe_due or (use_js and await asyncio.to_thread(JsRouter.has_structured_price, page)):
+            # Try the cheap plain HTTP path first, JS trackers are switched over once it keeps working
+            try:
+                http_texts = await fetch_selector_texts(url, all_selectors, False, page.get('key'), optional)
+            except Exception as e:
+                # Shops that reject plain clients still get rendered, the probe waits for its next interval
+                lh.log(f"Plain HTTP attempt for JS page {url} failed, rendering it instead: {e}", "log")
+                http_texts = None
+                await asyncio.to_thread(JsRouter.record_http_failure, page, probe_due)
+            if http_texts is not None:
+                if probe_due and await asyncio.to_thread(JsRouter.record_http_probe, page, http_texts, batch):
+                    texts = http_texts
+                    use_js = False
+                elif JsRouter.texts_have_prices(http_texts, [STRUCTURED]):
+                    lh.log(f"Found structured data price for {url} over plain HTTP, skipping Selenium", "success")
+                    texts = http_texts
+                    use_js = False
+        if texts is None:
+            texts = await fetch_selector_texts(url, all_selectors, use_js, page.get('key'), optional)
+        if not use_js and not page['js'] and await asyncio.to_thread(JsRouter.should_probe_js, page, texts):
+            try:
+                js_texts = await fetch_selector_texts(url, all_selectors, True, page.get('key'))
+            except Exception as e:
+                # Keep the plain HTTP results, the probe is retried next scan
+                lh.log(f"Selenium probe for {url} failed: {e}", "warn")
+                js_texts = None
+            if js_texts is not None and await asyncio.to_thread(JsRouter.record_js_probe, page, texts, js_texts, batch):
+                texts = js_texts
+                use_js = True
+    except DomainScheduler.DomainThrottled as e:
+        lh.log(f"Backing off from {url}: {e}", "warn")
+        return [ScrapeResult.failure(ScrapeResult.BLOCKED, str(e))] * len(entries)
+    except Exception as e:
+        status = ScrapeResult.classify_exception(e)
+        lh.log(f"Error extracting prices for {url} ({status}): {e}", "error")
+        return [ScrapeResult.failure(status, str(e))] * len(entries)
 
-                        if guild_id is not None:
-                            for site in data.get('global', {}).get(str(guild_id), []):
-                                if site['id'] == object['id']:
-                                    site['selector'] = selector
-                                    updated = True
-                                    break
+    fallback_texts = texts
+    # Only re-fetch in the domain's render mode when neither its selectors nor structured data matched this document
+    needs_refetch = (
+        js_required != use_js
+        and not texts.get(STRUCTURED)
+        and not any(texts.get(s) is not None for s in known_selectors)
+    )
+    prices = []
+    for entry in entries:
+        object = entry['tracker']
+        guild_id = entry['guild_id']
+        user_id = entry['user_id']
+        try:
+            selector = object['selector']
+            lh.log(f"Using selector: {selector} for ID: {object['id']}", "log")
+            price_text = texts.get(selector)
 
-                        elif user_id is not None:
+            if price_text is None:
+                if needs_refetch and known_selectors:
+                    # Known selectors for this domain need the other render mode, fetch that once
+                    needs_refetch = False
+                    fallback_texts = await fetch_selector_texts(url, known_selectors, js_required)
 
-                            for tracker in data.get('users', {}).get(str(user_id), []):
+                for alt_selector in known_selectors:
 
-                                if tracker['id'] == object['id']:
+                    if alt_selector == selector:
+                        continue
 
-                                    tracker['selector'] = selector
-                                    updated = True
-                                    break
-                        if updated:
+                    price_text = (fallback_texts or {}).get(alt_selector)
 
-                            with open(data_path, 'w') as f:
-                                json.dump(data, f, indent=2)
+                    if price_text is not None:
+                        selector = alt_selector
+                        if batch is not None:
+                            await asyncio.to_thread(batch.add_selector, object['uuid'], selector)
+                        else:
+                            await asyncio.to_thread(JsonHandler.update_tracker_selector, object['id'], selector, guild_id, user_id)
                         break
 
-            if not price_element:
+            if price_text is None and texts.get(STRUCTURED):
+                lh.log(f"Selectors missed for {object['name']}, using the page's structured data price", "log")
+                price_text = StructuredData.format_like(texts[STRUCTURED], object.get('currentPrice', '').replace("€", ""))
+
+            if price_text is None:
 
                 lh.log(f"Could not find price element for {object['name']} with any known selector. Item might be sold out, on sale, or the selector has changed.", "warn")
 
                 if discord_notify:
-                    _loop = loop
-                    if _loop is None:
-                        try:
-                            _loop = asyncio.get_running_loop()
-                        except RuntimeError:
-                            _loop = None
-                    if _loop:
-                        asyncio.run_coroutine_threadsafe(discord_notify(object, user_id), _loop)
-                return None
-            price_text = price_element.get_text(strip=True)
-            lh.log(f"Extracted price text for {object['name']}: '{price_text}'", "log")
-            match = re.search(r'\d+(?:[.,]\d{2})?', price_text)
-            if match:
-                clean_price = match.group(0)
-                lh.log(f"Cleaned price for {object['name']}: '{clean_price}'", "log")
-            else:
-                lh.log(f"Could not extract price from text: '{price_text}'", "error")
-                return None
-            if guild_id is not None:
-                JsonHandler.update_site_price(object['id'], clean_price, guild_id)
+                    _loop = loop or asyncio.get_running_loop()
+                    _loop.create_task(discord_notify(object, user_id))
+                prices.append(ScrapeResult.failure(ScrapeResult.SELECTOR_MISS, selector))
+                continue
+            clean_price = clean_scraped_price(object, price_text)
+            if clean_price is None:
+                prices.append(ScrapeResult.failure(ScrapeResult.PARSE_ERROR, price_text))
+                continue
+            if batch is not None:
+                await asyncio.to_thread(batch.add_price, object['uuid'], clean_price)
+            elif guild_id is not None:
+                await asyncio.to_thread(JsonHandler.update_site_price, object['id'], clean_price, guild_id)
             elif user_id is not None:
-                JsonHandler.update_user_tracker_price(user_id, object['id'], clean_price)
-            return clean_price
+                await asyncio.to_thread(JsonHandler.update_user_tracker_price, user_id, object['id'], clean_price)
+            prices.append(ScrapeResult.success(clean_price))
         except Exception as e:
             lh.log(f"Error extracting price for {object.get('name', 'unknown')}: {e}", "error")
-            return None
-    return await asyncio.to_thread(blocking_scrape)
+            prices.append(ScrapeResult.failure(ScrapeResult.classify_exception(e), str(e)))
+    return prices
 
-def selector_works_without_js(url, selector, expected_price):
-    """Try to fetch the price with requests/BeautifulSoup and compare, with cleaning and logging."""
-    lh.log(f"Checking if selector works without JS for URL: {url}", "log")
-    try:
-        resp = requests.get(url, timeout=10)
-        if resp.status_code != 200:
-            lh.log(f"Failed to fetch page (status {resp.status_code}) for {url}", "warn")
-            return False
-        soup = BeautifulSoup(resp.text, "lxml")
-        el = soup.select_one(selector)
-        if el and el.get_text(strip=True):
-            found_price = el.get_text(strip=True)
-            cleaned_found = clean_price_text(found_price)
-            cleaned_expected = clean_price_text(expected_price)
-            lh.log(f"Selector '{selector}' found price: '{found_price}' (cleaned: '{cleaned_found}', expected: '{expected_price}', cleaned expected: '{cleaned_expected}')", "log")
-            if cleaned_found == cleaned_expected:
-                lh.log("Selector works without JS (cleaned price matches).", "success")
-                return True
-            else:
-                lh.log("Selector found price without JS, but cleaned value does not match expected.", "warn")
-        else:
-            lh.log(f"Selector '{selector}' did not find a price without JS.", "warn")
-    except Exception as e:
-        lh.log(f"Exception during non-JS selector check: {e}", "error")
-    return False
+async def extractPrice(object, DEBUG, guild_id=None, user_id=None, discord_notify=None, loop=None):
+    """Scrape a single tracker and return its ScrapeResult."""
+    page = {
+        "url": object['url'],
+        "js": object.get('js', False),
+        "selectors": [object['selector']],
+        "entries": [ScanPlanner.make_entry(object, guild_id=guild_id, user_id=user_id)],
+    }
+    results = await extractPagePrices(page, DEBUG, discord_notify=discord_notify, loop=loop)
+    return results[0]
 
 def getAllPrices(DEBUG, private_tracks_enabled, guild_id ,user_id=None):
     # Get tracker info only (not prices) from JSON
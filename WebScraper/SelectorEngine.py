@@ -0,0 +1,171 @@
+import re
+from functools import lru_cache
+from lxml import etree
+from cssselect import HTMLTranslator, SelectorError
+from bs4 import BeautifulSoup
+import LogHandler as lh
+import StructuredData
+
+# Pseudo-classes whose result can change as later siblings arrive, these are only
+# evaluated once the whole document has been parsed
+STREAM_UNSAFE_RE = re.compile(r':(nth-)?last|:only-|:empty|:has\(', re.I)
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+# Elements whose text isn't shown on the page
+NON_TEXT_TAGS = {"script", "style", "template"}
+
+_translator = HTMLTranslator()
+
+
+@lru_cache(maxsize=2048)
+def compile_selector(selector):
+    """Compile a CSS selector to an lxml XPath once, returns None if lxml can't handle it."""
+    try:
+        return etree.XPath(_translator.css_to_xpath(selector))
+    except (SelectorError, etree.XPathSyntaxError, ValueError):
+        return None
+
+
+def element_text(element):
+    """Same result as BeautifulSoup's get_text(strip=True) for an lxml element.
+
+    Like get_text, the text of script, style and template descendants and of comments is left out.
+    """
+    parts = []
+
+    def collect(node):
+        if node.text:
+            parts.append(node.text.strip())
+        for child in node:
+            # Comments and processing instructions have a function as tag
+            if isinstance(child.tag, str) and child.tag not in NON_TEXT_TAGS:
+                collect(child)
+            if child.tail:
+                parts.append(child.tail.strip())
+
+    collect(element)
+    return "".join(parts)
+
+
+def soup_select_text(root, selectors):
+    """Evaluate selectors lxml can't compile with BeautifulSoup on the parsed tree."""
+    soup = BeautifulSoup(etree.tostring(root, encoding="unicode"), "lxml")
+    results = {}
+    for selector in selectors:
+        try:
+            element = soup.select_one(selector)
+        except Exception as e:
+            lh.log(f"Invalid selector '{selector}': {e}", "warn")
+            element = None
+        results[selector] = element.get_text(strip=True) if element is not None else None
+    return results
+
+
+def parse_html(html_text):
+    """Parse a full HTML document with lxml, returns the root element or None for empty input."""
+    if not html_text:
+        return None
+    parser = etree.HTMLParser(encoding="utf-8")
+    return etree.fromstring(html_text.encode("utf-8", errors="replace"), parser)
+
+
+def select_texts_from_root(root, selectors):
+    """Evaluate every selector against one parsed tree, returns {selector: text or None}."""
+    results = {}
+    unsupported = []
+    for selector in selectors:
+        if root is None:
+            results[selector] = None
+            continue
+        if selector == StructuredData.STRUCTURED_SELECTOR:
+            results[selector] = StructuredData.extract_price(root)
+            continue
+        xpath = compile_selector(selector)
+        if xpath is None:
+            unsupported.append(selector)
+            continue
+        matches = xpath(root)
+        results[selector] = element_text(matches[0]) if matches else None
+    if unsupported:
+        results.update(soup_select_text(root, unsupported))
+    return results
+
+
+def is_css_selector(selector):
+    """False for pseudo-selectors like StructuredData.STRUCTURED_SELECTOR that browsers can't evaluate."""
+    return selector != StructuredData.STRUCTURED_SELECTOR
+
+
+def select_texts(html_text, selectors):
+    """Parse HTML once and evaluate all candidate selectors on the same tree."""
+    return select_texts_from_root(parse_html(html_text), selectors)
+
+
+def detect_charset(first_chunk, header_charset=None):
+    if header_charset:
+        return header_charset
+    match = META_CHARSET_RE.search(first_chunk[:4096])
+    if match:
+        return match.group(1).decode("ascii", errors="ignore")
+    return "utf-8"
+
+
+class StreamingMatcher:
+    """Feed an HTML body chunk by chunk and collect selector matches as their elements close.
+
+    feed() returns True once every selector has a complete match, so the caller can
+    stop downloading. close() evaluates whatever is still missing on the full tree.
+    Optional selectors don't hold up the early stop, they are evaluated on whatever
+    was received by then.
+    """
+
+    def __init__(self, selectors, charset=None, optional=()):
+        self.selectors = list(selectors)
+        self.required = [s for s in self.selectors if s not in optional]
+        self.header_charset = charset
+        self.parser = None
+        self.root = None
+        self.results = {}
+        self.bytes_fed = 0
+        self._next_check = 0
+        self.streamable = [
+            s for s in self.selectors
+            if is_css_selector(s) and compile_selector(s) is not None and not STREAM_UNSAFE_RE.search(s)
+        ]
+
+    def feed(self, chunk):
+        if self.parser is None:
+            self.parser = etree.HTMLPullParser(events=("start",), encoding=detect_charset(chunk, self.header_charset))
+        self.parser.feed(chunk)
+        self.bytes_fed += len(chunk)
+        for _, element in self.parser.read_events():
+            if self.root is None:
+                self.root = element.getroottree().getroot()
+        # Re-running the selectors on the growing tree is linear in its size, so check
+        # at doubling offsets to keep the total work linear in the document size
+        if self.root is None or self.bytes_fed < self._next_check:
+            return False
+        self._next_check = self.bytes_fed * 2
+        for selector in self.streamable:
+            if selector in self.results:
+                continue
+            matches = compile_selector(selector)(self.root)
+            # An element is complete once the parser has produced anything after it
+            if matches and matches[0].xpath("boolean(following::*)"):
+                self.results[selector] = element_text(matches[0])
+        return self.done()
+
+    def done(self):
+        return bool(self.required) and all(s in self.results for s in self.required)
+
+    def close(self):
+        """Finish parsing what was received and return {selector: text or None}."""
+        if self.parser is not None:
+            try:
+                root = self.parser.close()
+            except etree.XMLSyntaxError:
+                root = self.root
+            if root is not None:
+                self.root = root
+        missing = [s for s in self.selectors if s not in self.results]
+        self.results.update(select_texts_from_root(self.root, missing))
+        return self.results
@@ -0,0 +1,114 @@
+import json
+import re
+
+# Pseudo-selector for trackers whose price comes from structured data instead of an element
+STRUCTURED_SELECTOR = "structured-data:price"
+
+PRICE_META_XPATH = '//meta[@property="product:price:amount" or @property="og:price:amount" or @itemprop="price"]/@content'
+PRICE_RE = re.compile(r'\d+(?:[.,]\d+)*')
+
+
+def _types(node):
+    node_type = node.get("@type", [])
+    if isinstance(node_type, str):
+        node_type = [node_type]
+    return {t.split("/")[-1] for t in node_type if isinstance(t, str)}
+
+
+def _offer_price(offers):
+    if isinstance(offers, list):
+        for offer in offers:
+            price = _offer_price(offer)
+            if price is not None:
+                return price
+        return None
+    if not isinstance(offers, dict):
+        return None
+    for key in ("price", "lowPrice"):
+        value = offers.get(key)
+        if value not in (None, ""):
+            return value
+    spec = offers.get("priceSpecification")
+    if spec is not None:
+        return _offer_price(spec)
+    return None
+
+
+def _find_jsonld_price(node):
+    if isinstance(node, list):
+        for item in node:
+            price = _find_jsonld_price(item)
+            if price is not None:
+                return price
+        return None
+    if not isinstance(node, dict):
+        return None
+    types = _types(node)
+    if "Product" in types or "ProductGroup" in types:
+        price = _offer_price(node.get("offers"))
+        if price is not None:
+            return price
+    if types & {"Offer", "AggregateOffer"}:
+        price = _offer_price(node)
+        if price is not None:
+            return price
+    for key in ("@graph", "mainEntity", "itemListElement", "hasVariant"):
+        if key in node:
+            price = _find_jsonld_price(node[key])
+            if price is not None:
+                return price
+    return None
+
+
+def _normalize(value):
+    if isinstance(value, (int, float)):
+        return f"{value:.2f}" if value != int(value) else str(int(value))
+    match = PRICE_RE.search(str(value))
+    return match.group(0) if match else None
+
+
+def extract_price(root):
+    """Return the product price from JSON-LD, OpenGraph/product meta tags or microdata, or None."""
+    if root is None:
+        return None
+    for script in root.xpath('//script[@type="application/ld+json"]'):
+        try:
+            data = json.loads(script.text or "", strict=False)
+        except ValueError:
+            continue
+        price = _find_jsonld_price(data)
+        if price is not None:
+            normalized = _normalize(price)
+            if normalized:
+                return normalized
+    for content in root.xpath(PRICE_META_XPATH):
+        normalized = _normalize(content)
+        if normalized:
+            return normalized
+    for element in root.xpath('//*[@itemprop="price"]'):
+        normalized = _normalize(element.get("content") or "".join(element.itertext()))
+        if normalized:
+            return normalized
+    return None
+
+
+def split_price(price):
+    """Split a price string into (whole, cents), the last separator followed by 1-2 digits is the decimal one."""
+    match = re.match(r'^(.*?)[.,](\d{1,2})$', price)
+    if match:
+        return re.sub(r'\D', '', match.group(1)), match.group(2)
+    return re.sub(r'\D', '', price), ""
+
+
+def format_like(price, reference):
+    """Write a structured-data price the way the tracker's stored price is written."""
+    if not price or not reference:
+        return price
+    whole, cents = split_price(price)
+    ref_whole, ref_cents = split_price(reference)
+    cents = cents.ljust(2, "0") if cents else ("00" if ref_cents else "")
+    if ref_cents:
+        return f"{whole}{reference[-len(ref_cents) - 1]}{cents}"
+    if cents and cents != "00":
+        return f"{whole}.{cents}"
+    return whole
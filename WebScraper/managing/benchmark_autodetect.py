@@ -0,0 +1,149 @@
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bs4 import BeautifulSoup
+import AutoDetectPrice
+
+# Reference copy of the detector before the single-pass rewrite, kept to check results and speed
+
+def legacy_find_price_candidates(soup):
+    price_regex = re.compile(r'(\$|€|£|¥|₹|USD|EUR|GBP|CAD|AUD|CHF|RUB|\bkr\b|\bPLN\b|\bCZK\b|\bSEK\b|\bNOK\b|\bDKK\b)?\s?\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?\s?(USD|EUR|GBP|CAD|AUD|CHF|RUB|kr|PLN|CZK|SEK|NOK|DKK|€|£|¥|₹)?', re.I)
+    candidates = []
+    for el in soup.find_all(string=True):
+        text = el.strip()
+        if not text:
+            continue
+        if price_regex.search(text):
+            parent = el.parent
+            if parent.name in ['s', 'strike', 'del']:
+                continue
+            style = parent.get('style', '')
+            if 'line-through' in style or 'text-decoration:line-through' in style:
+                continue
+            color_match = re.search(r'color\s*:\s*([^;]+)', style)
+            if color_match and AutoDetectPrice.is_grey_color(color_match.group(1)):
+                continue
+            ancestor = parent
+            crossed_out = False
+            while ancestor:
+                if ancestor.name in ['s', 'strike', 'del']:
+                    crossed_out = True
+                    break
+                style = ancestor.get('style', '')
+                if 'line-through' in style or 'text-decoration:line-through' in style:
+                    crossed_out = True
+                    break
+                if ancestor.has_attr('data-a-strike') and ancestor['data-a-strike'] == 'true':
+                    crossed_out = True
+                    break
+                color_match = re.search(r'color\s*:\s*([^;]+)', style)
+                if color_match and AutoDetectPrice.is_grey_color(color_match.group(1)):
+                    crossed_out = True
+                    break
+                ancestor = ancestor.parent if hasattr(ancestor, 'parent') else None
+            if crossed_out:
+                continue
+            selector = legacy_get_css_selector(parent)
+            font_size = None
+            if 'font-size' in style:
+                match = re.search(r'font-size\s*:\s*([\d.]+)px', style)
+                if match:
+                    font_size = float(match.group(1))
+            candidates.append((parent, selector, text, font_size))
+    return candidates
+
+def legacy_get_css_selector(element):
+    path = []
+    while element and element.name != '[document]':
+        selector = element.name
+        if element.get('id'):
+            selector += f"#{element['id']}"
+            path.insert(0, selector)
+            break
+        elif element.get('class'):
+            valid_classes = [AutoDetectPrice.escape_class(cls) for cls in element.get('class', []) if not any(c in cls for c in '[]:')]
+            if valid_classes:
+                selector += '.' + '.'.join(valid_classes)
+        siblings = element.find_previous_siblings(element.name)
+        if siblings:
+            selector += f":nth-child({len(siblings)+1})"
+        path.insert(0, selector)
+        if element.get('class') and not siblings:
+            break
+        element = element.parent
+    return ' > '.join(path)
+
+def synthetic_page(products=400, seed=1):
+    """A product listing shaped like a large shop page, used when no saved pages are given."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(products):
+        price = f"{rng.randint(1, 2999)},{rng.randint(0, 99):02d}"
+        old = f"<span style=\"color: #999\">€ {rng.randint(3000, 3999)},00</span>" if i % 3 == 0 else ""
+        strike = f"<del>€ {price}</del>" if i % 5 == 0 else ""
+        rows.append(
+            f"<li><div><div><div class=\"card\"><a href=\"/p/{i}\">Product {i}</a>"
+            f"<p>Rated {rng.randint(1, 5)} of 5 by {rng.randint(1, 900)} buyers</p>"
+            f"<div class=\"prices\">{old}{strike}<span>Now</span><span class=\"price\">€ {price}</span></div>"
+            f"<!-- {i} --></div></div></div></li>"
+        )
+    # Classless option tables make the legacy selector builder count siblings on every level
+    options = "".join(
+        f"<tr><td>Option {i}</td><td>+ € {rng.randint(1, 99)},{rng.randint(0, 99):02d}</td></tr>"
+        for i in range(products // 2)
+    )
+    return (
+        f"<!DOCTYPE html><html><body><div id=\"main\"><ul>{''.join(rows)}</ul></div>"
+        f"<section><table>{options}</table></section>"
+        f"<footer><div><div>© 2024</div></div></footer></body></html>"
+    )
+
+def best_time(func, soup, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(soup)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def same_candidates(old, new):
+    return len(old) == len(new) and all(
+        a[0] is b[0] and a[1:] == b[1:] for a, b in zip(old, new)
+    )
+
+def benchmark(name, html, runs=3):
+    soup = BeautifulSoup(html, 'lxml')
+    legacy_time, legacy = best_time(legacy_find_price_candidates, soup, runs)
+    new_time, new = best_time(AutoDetectPrice.find_price_candidates, soup, runs)
+    status = "same" if same_candidates(legacy, new) else "DIFFERENT"
+    print(f"{name}: {len(html) // 1024} KB, {len(new)} candidates ({status}) | "
+          f"legacy {legacy_time * 1000:.1f} ms, single pass {new_time * 1000:.1f} ms, "
+          f"{legacy_time / max(new_time, 1e-9):.1f}x")
+    return status == "same"
+
+def collect_pages(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for file_name in sorted(os.listdir(path)):
+                if file_name.endswith((".html", ".htm")):
+                    yield os.path.join(path, file_name)
+        else:
+            yield path
+
+if __name__ == "__main__":
+    # Usage: python benchmark_autodetect.py [saved_page.html | directory_of_pages ...]
+    ok = True
+    pages = list(collect_pages(sys.argv[1:]))
+    if not pages:
+        print("No saved pages given, using synthetic listings")
+        for products in (50, 400, 1500):
+            ok &= benchmark(f"synthetic-{products}", synthetic_page(products))
+    for path in pages:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            ok &= benchmark(os.path.basename(path), f.read())
+    sys.exit(0 if ok else 1)
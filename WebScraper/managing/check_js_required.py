@@ -1,40 +1,28 @@
-import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.firefox.service import Service
-import platform
+import os
 import sys
 
-if platform.system() == "Windows":
-    GECKODRIVER_PATH = r"C:\\Coding\\Github\\WebScrapingDiscordBot\\WebScraper\\bin\\geckodriver\\geckodriver.exe"
-else:
-    GECKODRIVER_PATH = "/usr/bin/geckodriver"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import DriverPool
+import HttpClient
+import SelectorEngine
 
 def check_js_required(url, selector):
     # Try without JS
     try:
-        resp = requests.get(url, timeout=10)
+        resp = HttpClient.get(url)
         if resp.status_code == 200:
-            soup = BeautifulSoup(resp.text, "lxml")
-            el = soup.select_one(selector)
-            if el and el.get_text(strip=True):
-                print(f"Selector '{selector}' found price WITHOUT JS: '{el.get_text(strip=True)}'")
+            price_text = SelectorEngine.select_texts(resp.text, [selector])[selector]
+            if price_text:
+                print(f"Selector '{selector}' found price WITHOUT JS: '{price_text}'")
                 return False
     except Exception as e:
         print(f"Error fetching without JS: {e}")
     # Try with JS
     try:
-        options = webdriver.FirefoxOptions()
-        options.add_argument('--headless')
-        service = Service(GECKODRIVER_PATH)
-        driver = webdriver.Firefox(service=service, options=options)
-        driver.get(url)
-        html = driver.page_source
-        driver.quit()
-        soup = BeautifulSoup(html, "lxml")
-        el = soup.select_one(selector)
-        if el and el.get_text(strip=True):
-            print(f"Selector '{selector}' found price WITH JS: '{el.get_text(strip=True)}'")
+        html = DriverPool.fetch_rendered_html(url)
+        price_text = SelectorEngine.select_texts(html, [selector])[selector]
+        if price_text:
+            print(f"Selector '{selector}' found price WITH JS: '{price_text}'")
             return True
         else:
             print(f"Selector '{selector}' did not find price even with JS.")